@@ -32,8 +32,10 @@ meanraw = True
 #do further overvieplots:
 dooverview = True
 
+#save the peak plots of every respondent and sequence (out/peaks* folders). False: only count the peaks, nothing is drawn
+respondentpeakplots = True
+
 
-import matplotlib.pyplot as plt
 import numpy as np
 import time
 # from bin.BH import *
@@ -41,10 +43,10 @@ import time
 # release: root_v5.34.36.win32.vc12.exe (windows release, but available for MAC and most linux distributions)) (requires VC++ 12.0)
 # import ROOT
 import sys
-import pandas as pd
 
 # sys.path.append('/Applications/root_v5.34.36/lib')
-from ROOT import TH1F, TSpectrum, TFile, TCanvas, TLegend, TStyle, gStyle, gROOT, TLatex
+# ROOT, pandas and matplotlib are imported by the stages that use them, when they run - importing this module only
+# defines the settings and functions
 
 #plot styling can be defined here:
 #import myrootstyle
@@ -52,17 +54,19 @@ from ROOT import TH1F, TSpectrum, TFile, TCanvas, TLegend, TStyle, gStyle, gROOT
 
 
 #
-from matplotlib.font_manager import FontProperties
 import os
-import pyvttbl as pt  # Repeated measures anova
-from collections import namedtuple  # Dependencies of pyvttbl
-from scipy.stats import ttest_ind
-
-gStyle.SetOptTitle(0)
-gStyle.SetOptStat(0)
-# output to file:
-# f = open(os.path.join(os.getcwd(), '../out/output.txt'), 'w')
-f = open('../out/output.txt', 'w')
+from itertools import izip
+from components import tonic_phasic
+from datareader import read_respondents
+from events import EventIndex, event_mask
+from histograms import bin_centers, contents, errors, fill, find_bin
+from means import clip_means, interval_means
+from peakextraction import extract_respondents, range_peaks
+from peakfinder import peakfinder
+import partials
+from rendering import PlotSpec, render
+from signalstore import SignalStore, StoreWriter, normalize
+
 # ASSUMPTIONS #
 # timesteps of 32ms so 48*32/1000 s = 1,536 s
 # 5 * 1000 / 32 = 156,25 ~ 156
@@ -74,6 +78,12 @@ timewindow = 30 # 10 sek bins for peak finding and mean EDA
 binscale = 1./1000. #32. / 60000.  # 1 sek/bin
 sigmapeaksinterval = 4 # the significance required above background for peaks
 peakamplitude = 0.05
+peakbackend = 'tspectrum' # peak finder: 'tspectrum' (ROOT). 'numpy' (port of TSpectrum without ROOT, see peakfinder.py) is
+                          # experimental: it is not yet checked against recorded TSpectrum results
+validatepeaks = False # also run the other peak finder and report clips where the found peaks differ
+peak_workers = 4 # processes extracting peaks and background per respondent for the time distribution plots
+render_workers = 4 # processes drawing the respondent and peak plots at the end of the run
+plot_manifest = '../out/plots.manifest' # inputs of the plots drawn last time: plots whose inputs did not change are not redrawn
 endbuffer = 0
 
 #### datafile tag definitions - these match naming scheme of Biometric Software Suite output-files
@@ -107,36 +117,69 @@ Comparison_list = {'1':['01_Indledning.avi','01_Indledning.avi'],
 folder_path = 'C:/Data/HistorienOmDK/rest/'
 filename_ext = '.txt'
 
+# Parsed datafiles are kept in a binary cache, so re-running with other plot settings skips the text parsing.
+# Entries are rebuilt automatically when a datafile changes.
+usecache = True
+cache_dir = '../out/cache/'
+# Incremental re-analysis: the peak results of every respondent are stored in partials_dir and reused while the datafile
+# and the settings are unchanged, so adding a datafile only runs the peak search for the new respondent.
+incremental = True
+partials_dir = '../out/partials/'
+# Keep the signals in memory-mapped files in store_dir (one segment per respondent and signal) instead of in memory,
+# for cohorts like alle/ that do not fit in RAM
+ondiskstore = False
+store_dir = '../out/store/'
+# Number of processes parsing datafiles in parallel (1 = one file after the other)
+ingest_workers = 4
 
-## FUNCTIONS ##
-def dataextract(files, label):
-    fhandle = open(folder_path + files, 'r')
-
-    temp_data = list()
-    n = 0
-
-    for p in fhandle:
-
-        p1 = p.split(delimiter)
-
-        if n == 0:
-            label_lookup = p1.index(label)
 
-        elif n != 0:
-
-            if p1[label_lookup] != '':
-                temp_data.append(float(p1[label_lookup].replace(',', '.')))
-
-            elif p1[label_lookup] == '':
-                if(len(temp_data)==0):
-                    temp_data.append(0)
-                else:
-                    temp_data.append(temp_data[len(temp_data) - 1])
-
-        n = n + 1
-
-    fhandle.close()
-    return (temp_data)
+## FUNCTIONS ##
+# loads ROOT for the stages that make histograms, in batch mode and with the plot style of the output
+def rootsetup():
+    from ROOT import gROOT, gStyle
+    gROOT.SetBatch(True)  # canvases are only saved to files, never shown on screen
+    gStyle.SetOptTitle(0)
+    gStyle.SetOptStat(0)
+
+# what the stages below share during a run: the log, the peak finders, the plots recorded for render() and what was
+# read per respondent. The main script fills `state` while reading the datafiles; to run the stages from another
+# script, set Fysiologisk.state = RunState(log) and add the respondents with add_respondent() the same way.
+class RunState(object):
+    def __init__(self, log=sys.stdout):
+        self.log = log
+        self.checkbackend = ('numpy' if peakbackend == 'tspectrum' else 'tspectrum') if validatepeaks else None
+        if peakbackend != 'tspectrum':
+            print >> log, "WARNING! peakbackend", peakbackend, "is experimental, use 'tspectrum' for results"
+        self._finders = dict()  # created on first use, so ROOT is only loaded by a run that searches peaks with it
+        self.plotspecs = list()  # plots recorded during the analysis, drawn by render() at the end
+        self.event_indices = {}  # respondent -> EventIndex with the name, start and stop of every clip
+        self.event_names = list()  # event names of every respondent, in file order
+        self.files = {}  # respondent -> datafile, the key of its partial results
+        self.digests = {}  # respondent -> SHA-1 of its datafile, hashed once while reading it
+        # everything besides the datafile that the signals depend on (partial results made with other settings are
+        # stale)
+        self.partial_tag = repr((sync_pos, eda_data, list(pupil_data), event_data, list(Events_list), delimiter,
+                                 endbuffer, rolling_average_window))
+
+    @property
+    def finder(self):
+        if 'finder' not in self._finders:
+            self._finders['finder'] = peakfinder(peakbackend)
+        return self._finders['finder']
+
+    @property
+    def checkfinder(self):
+        if self.checkbackend and 'check' not in self._finders:
+            self._finders['check'] = peakfinder(self.checkbackend)
+        return self._finders.get('check')
+
+    def add_respondent(self, name, datafile, digest, event_names, event_positions, syncpos):
+        self.event_names.append(event_names)
+        self.event_indices[name] = EventIndex(event_names, event_positions, syncpos)
+        self.files[name] = datafile
+        self.digests[name] = digest
+
+state = RunState()
 
 #create dir if not exist
 def ensure_dir(f):
@@ -144,17 +187,91 @@ def ensure_dir(f):
     if not os.path.exists(d):
         os.makedirs(d)
 
+# peaks in the range of hist set with SetRangeUser, found by the selected backend: positions (bin centres) and the
+# Background(hist, 20, "Compton") contents of all bins (0 outside the range) - as TSpectrum.Search/Background give them
+def findpeaks(hist, withbackground=True):
+    axis = hist.GetXaxis()
+    peaksx, bg, message = range_peaks(state.finder, contents(hist), axis.GetFirst(), axis.GetLast(),
+                                      bin_centers(hist.GetNbinsX(), axis.GetXmin(), axis.GetXmax()),
+                                      sigmapeaksinterval, peakamplitude, withbackground, state.checkfinder)
+    if message:
+        print >> state.log, "Peak finders disagree in " + hist.GetName() + " " + message
+    return peaksx, bg
+
+# records the plot of hist with the peaks and background found in its range, saved as the png `path` when the plots
+# are rendered at the end of the run; returns the peaks
+def plotpeaks(hist, path):
+    peaksx, bg = findpeaks(hist)
+    axis = hist.GetXaxis()
+    binned = contents(hist)
+    nbins, xlow, xup = hist.GetNbinsX(), axis.GetXmin(), axis.GetXmax()
+    state.plotspecs.append(PlotSpec('peaks', path, contents=binned, errors=errors(hist), axis=(nbins, xlow, xup),
+                                    range=(axis.GetFirst(), axis.GetLast()), background=bg, peaksx=peaksx,
+                                    peaksy=binned[find_bin(peaksx, nbins, xlow, xup).astype(int)]))
+    return peaksx
+
+# the peak plots recorded for a respondent as arrays for its npeaks partial, and the inverse: an incremental run records
+# the plots of the unchanged respondents from their partials, so render() gets the same plots as in a full run
+peakplotfields = ('contents', 'errors', 'axis', 'range', 'background', 'peaksx', 'peaksy')
+
+def packpeakplots(specs):
+    arrays = partials.pack_windows([tuple(np.asarray(getattr(spec, field)) for field in peakplotfields)
+                                    for spec in specs])
+    arrays['paths'] = np.array([spec.path for spec in specs], dtype=str)
+    return arrays
+
+def recordpeakplots(arrays):
+    for path, plot in zip(arrays['paths'], partials.unpack_windows(arrays)):
+        data = dict(zip(peakplotfields, plot))
+        data['axis'] = (int(data['axis'][0]), float(data['axis'][1]), float(data['axis'][2]))
+        data['range'] = (int(data['range'][0]), int(data['range'][1]))
+        state.plotspecs.append(PlotSpec('peaks', str(path), **data))
+
+# the partial result of `step` stored for respondent in an earlier run, or None if its datafile or the settings
+# changed since (or incremental is off)
+def loadpartial(step, respondent, settings):
+    if not incremental:
+        return None
+    return partials.load(partials_dir, step, state.files[respondent], repr((state.partial_tag, settings)),
+                         state.digests[respondent])
+
+def savepartial(step, respondent, settings, arrays):
+    if incremental:
+        partials.save(partials_dir, step, state.files[respondent], repr((state.partial_tag, settings)), arrays,
+                      state.digests[respondent])
+
+# extract_respondents() for the (syncpos, values, windows) jobs of the respondents, with the peak search only run for
+# respondents without a valid partial result of `step`
+def extractpartials(step, respondents, jobs):
+    # with validatepeaks the partials are made with the check, so a validating run never reuses unchecked results
+    settings = (peakbackend, state.checkbackend, sigmapeaksinterval, peakamplitude)
+    results = list()
+    for respondent, (syncpos, values, windows) in zip(respondents, jobs):
+        stored = loadpartial(step, respondent, settings + (windows,))
+        results.append(partials.unpack_windows(stored) if stored is not None else None)
+    todo = [i for i in range(0, len(jobs)) if results[i] is None]
+    print >> state.log, "Extracting peaks (" + step + ") for " + str(len(todo)) + " of " + str(len(jobs)) + \
+                        " respondents"
+    extracted = extract_respondents([jobs[i] for i in todo], peak_workers, peakbackend, sigmapeaksinterval,
+                                    peakamplitude, state.checkbackend, state.log)
+    for i, windows in zip(todo, extracted):
+        results[i] = windows
+        savepartial(step, respondents[i], settings + (jobs[i][2],), partials.pack_windows(windows))
+    return results
+
 # returns number of peaks in a given subset (window) of the data.
 # TSpectrum finder (gausiske) peaks ud fra krav om standardafvigelse fra baggrund og et threshold. (peaks med amplitude under threshold*hoejeste_peak forkastes 0<threshold<1).
 # TSpectrum.Search(hist=input data, s= antal standardafvigelser (1 sigma), threshold=20%) https://root.cern.ch/doc/master/classTSpectrum.html
-def npeaks(dataset_index_sub, dataarray,name):
-    nbins = (len(dataset_event_names[0]) / 2)
+def npeaks(dataset_index_sub, store,name):
+    rootsetup()
+    from ROOT import TH1F
+    nbins = (len(state.event_names[0]) / 2)
     peakshist = TH1F("peaksperseq", "peaks per sequence", nbins, 0, nbins)
     #phasichist = TH1F("phasicsperseq", "phasic per sequence", nbins, 0, nbins)
     #tonichist = TH1F("tonicsperseq", "tonic per sequence", nbins, 0, nbins)
 
     ibin = 0
-    labels = sorted(dataset_event_names[0])
+    labels = sorted(state.event_names[0])
     for bin in range(0, nbins * 2):
         if bin % 2 == 0:
             ibin += 1
@@ -162,14 +279,25 @@ def npeaks(dataset_index_sub, dataarray,name):
             #phasichist.GetXaxis().SetBinLabel(ibin, labels[bin])
             #tonichist.GetXaxis().SetBinLabel(ibin, labels[bin])
 
+    settings = (name, binscale, peakbackend, state.checkbackend, sigmapeaksinterval, peakamplitude, respondentpeakplots)
     for respondent in dataset_index_sub:
-        respdataarray = dataarray.dropna(axis=0).loc[respondent]
+        events = state.event_indices[respondent]
+        stored = loadpartial('npeaks', respondent, settings)
+        if stored is not None and (not respondentpeakplots or 'paths' in stored):
+            # unchanged respondent: counted and plotted in an earlier run
+            for clip in range(0, len(events)):
+                peakshist.Fill(events.names[clip], stored['counts'][clip])
+            if respondentpeakplots:
+                recordpeakplots(stored)
+            continue
+        respdataarray = store.series(respondent)
+        counts = np.zeros(len(events))
+        firstplot = len(state.plotspecs)
 
         hist = TH1F(str(respondent) + "hist", str(respondent) + "hist", int((respdataarray.index[-1]*binscale)),
                     respdataarray.index[0], respdataarray.index[-1])
 
-        for i in range(0, len(respdataarray) - 1):
-            hist.Fill(respdataarray.index[i], respdataarray.values[i])
+        fill(hist, respdataarray.index.values[:-1], respdataarray.values[:-1])
         orig_integral = hist.Integral()
         # loop over series in timeunit of size: peaks_window
         #hist.GetXaxis().SetTitle('Time-position [ms]')
@@ -203,46 +331,29 @@ def npeaks(dataset_index_sub, dataarray,name):
         #             cmark.Close()
 
         ## First define peaks for full sequence from baseline untill last sequence
-        hist.GetXaxis().SetRangeUser(EventBinsPos[respondent][0] + (1 / binscale),
-                                     EventBinsPos[respondent][len(EventBinsPos[respondent])-1] - (1 / binscale))
-        # hist.Scale(1./hist.Integral(hist.GetXaxis().FindBin(EventBinsPos[respondent][clipindex]),
-        # hist.GetXaxis().FindBin(EventBinsPos[respondent][clipindex + 1])))
-        cmark = TCanvas("c", "c", 1200, 800)
-        cmark.cd()
-        hist.Draw()
-        s = TSpectrum()
-        np = s.Search(hist, sigmapeaksinterval, "noMarkov same", peakamplitude)
-        bg = s.Background(hist, 20, "Compton same")
-        cmark.Update()
-        dir = os.path.join(os.getcwd(), '../out/peaks' + name + '/overview/')
-        ensure_dir(dir)
-        cmark.SaveAs(dir + 'OverviewOf'+name+'Peaks_' + respondent + '.png')
-        cmark.Close()
+        hist.GetXaxis().SetRangeUser(events.first + (1 / binscale), events.last - (1 / binscale))
+        # hist.Scale(1./hist.Integral(hist.GetXaxis().FindBin(events.starts[clip]),
+        # hist.GetXaxis().FindBin(events.stops[clip])))
+        # (only plotted - the peaks of the full sequence are not counted)
+        if respondentpeakplots:
+            dir = os.path.join(os.getcwd(), '../out/peaks' + name + '/overview/')
+            plotpeaks(hist, dir + 'OverviewOf'+name+'Peaks_' + respondent + '.png')
 
         ## then for individual "clips"
-        for clipindex in range(0, len(EventBinsPos[respondent]) - 1):
-            if (clipindex % 2 == 0):
-
-                hist.GetXaxis().SetRangeUser(EventBinsPos[respondent][clipindex]+(1/binscale),
-                                         EventBinsPos[respondent][clipindex + 1]-(1/binscale))
-                #hist.Scale(1./hist.Integral(hist.GetXaxis().FindBin(EventBinsPos[respondent][clipindex]),
-                                            #hist.GetXaxis().FindBin(EventBinsPos[respondent][clipindex + 1])))
-                cmark = TCanvas("c", "c", 1200, 800)
-                cmark.cd()
-                hist.Draw()
-                s = TSpectrum()
-                np = s.Search(hist, sigmapeaksinterval, "noMarkov same", peakamplitude)
-                bg = s.Background(hist, 20, "Compton same")
-                cmark.Update()
-                dir = os.path.join(os.getcwd(), '../out/peaks'+name+'/'+EventBinsNames[respondent][clipindex]+'/')
-                ensure_dir(dir)
-                cmark.SaveAs(dir+'sequencepeaks_'+ respondent + '.png')
-                cmark.Close()
-                #test = EventBinsNames[respondent][clipindex]
-                peakshist.Fill(EventBinsNames[respondent][clipindex], np)
-                #phasichist.Fill(EventBinsNames[respondent][clipindex], np)
-                #tonichist.Fill(EventBinsNames[respondent][clipindex], np)
-                #hist.Scale(orig_integral/hist.Integral())
+        for clip in range(0, len(events)):
+            hist.GetXaxis().SetRangeUser(events.starts[clip]+(1/binscale), events.stops[clip]-(1/binscale))
+            #hist.Scale(1./hist.Integral(hist.GetXaxis().FindBin(events.starts[clip]),
+                                        #hist.GetXaxis().FindBin(events.stops[clip])))
+            if respondentpeakplots:
+                dir = os.path.join(os.getcwd(), '../out/peaks'+name+'/'+events.names[clip]+'/')
+                peaksx = plotpeaks(hist, dir+'sequencepeaks_'+ respondent + '.png')
+            else:
+                peaksx, bg = findpeaks(hist, withbackground=False)
+            peakshist.Fill(events.names[clip], len(peaksx))
+            counts[clip] = len(peaksx)
+            #phasichist.Fill(events.names[clip], len(peaksx))
+            #tonichist.Fill(events.names[clip], len(peaksx))
+            #hist.Scale(orig_integral/hist.Integral())
         # while (j < nbins):
         #     # create windows of peaks_window size (60 sec)
         #     hist.GetXaxis().SetRange(j, j + peaks_window)
@@ -252,34 +363,32 @@ def npeaks(dataset_index_sub, dataarray,name):
         #     indices.append(respondent)
         # values1.extend(peaskpertime1sig)
         hist.Delete()
+        stored = packpeakplots(state.plotspecs[firstplot:]) if respondentpeakplots else dict()
+        stored['counts'] = counts
+        savepartial('npeaks', respondent, settings, stored)
     return peakshist
     # return pd.Series(values1, index=indices)
 
-def meaneda(dataset_index_sub, dataarray):
-    nbins = (len(dataset_event_names[0]) / 2)
+def meaneda(dataset_index_sub, store):
+    rootsetup()
+    from ROOT import TH1F
+    nbins = (len(state.event_names[0]) / 2)
     values1 = TH1F("meanEDAperseq", "#mu_{EDA} per sequence", nbins, 0, nbins)
     values1.SetStats(False)
     ibin = 0
-    labels = sorted(dataset_event_names[0])
-    for bin in range(0, len(dataset_event_names[0])):
+    labels = sorted(state.event_names[0])
+    for bin in range(0, len(state.event_names[0])):
         if bin % 2 == 0:
             ibin += 1
             values1.GetXaxis().SetBinLabel(ibin, labels[bin])
 
+    # mean of every clip of every respondent in one go
+    clipmeans = clip_means(store, state.event_indices, dataset_index_sub)
     for respondent in dataset_index_sub:
-        respdataarray = dataarray.dropna(axis=0).loc[respondent]
-        # loop over series in timeunit of size: peaks_window
-        ## First define peaks per minute for full sequence
-        for clipindex in range(0, len(EventBinsPos[respondent]) - 1):
-            if (clipindex % 2 == 0):
-                hist = TH1F(str(respondent) + str(clipindex) +"hist", str(respondent) + str(clipindex) + "hist", int(len(respdataarray.values)),respdataarray.values.min(), respdataarray.values.max())
-                for i in range(0,len(respdataarray.values)):
-                    if respdataarray.index[i] > EventBinsPos[respondent][clipindex]:
-                        if respdataarray.index[i] <= EventBinsPos[respondent][clipindex+1]:
-                            hist.Fill(respdataarray.values[i])
-                meanfullrange = hist.GetMean()
-                values1.Fill(EventBinsNames[respondent][clipindex], meanfullrange)
-                hist.Delete()
+        events = state.event_indices[respondent]
+        means = clipmeans[respondent]
+        for clip in range(0, len(events)):
+            values1.Fill(events.names[clip], means[clip])
     return values1
 
 # def meaninterval2(dataset_index_sub, dataarray,timewindow):
@@ -305,8 +414,13 @@ def meaneda(dataset_index_sub, dataarray):
 #     return values1
 
 # saves a histogram with the events specified in comparisonlist plotted
-def meaninterval(dataset_index_sub, dataarray, comparisonlist,timewindow,name):
+def meaninterval(dataset_index_sub, store, comparisonlist,timewindow,name):
+    rootsetup()
+    from ROOT import TCanvas, TH1F, TLegend
     timeinterval=12000 # total of 12000/60 = 200 minutes now - corrected later on
+    # means per timewindow of all clips of all compared events, in one pass over the signal
+    allevents = [event for ikey in comparisonlist.keys() for event in comparisonlist[ikey]]
+    intervalmeans = interval_means(store, state.event_indices, allevents, timewindow, binscale, dataset_index_sub)
     for ikey in comparisonlist.keys():
         canvas = TCanvas("c", "mead EDA per respondent", 1200, 800)
         canvas.cd()
@@ -329,25 +443,9 @@ def meaninterval(dataset_index_sub, dataarray, comparisonlist,timewindow,name):
             histarray.append(tmphist)
 
         for event in comparisonlist[ikey]:
-            for respondent in dataset_index_sub:
-                respdataarray = dataarray.dropna(axis=0).loc[respondent]
-
-                for clipindex in range(0, len(EventBinsNames[respondent]) - 1):
-                    if EventBinsNames[respondent][clipindex] != event: continue
-                    if (clipindex % 2 == 0):
-                        a = EventBinsPos[respondent][clipindex] * binscale
-                        b = EventBinsPos[respondent][clipindex + 1] * binscale
-                        for interval in range(0, int(round( (b-a)/ timewindow))):
-                            hist = TH1F(str(respondent) + str(clipindex) + "hist", str(respondent) + "hist",
-                                        int(len(respdataarray.values)), respdataarray.values.min(),
-                                        respdataarray.values.max())
-                            for i in range(0, len(respdataarray.values)):
-                                if respdataarray.index[i] * binscale > a + interval * timewindow:
-                                    if respdataarray.index[i] * binscale <= a + interval * timewindow + timewindow:
-                                        hist.Fill(respdataarray.values[i])
-                            meaninterval = hist.GetMean()
-                            histarray[ievent].Fill(interval * timewindow, meaninterval)
-                            if (interval * timewindow) > maxvalx: maxvalx = interval * timewindow
+            x, means = intervalmeans[event]
+            fill(histarray[ievent], x, means)
+            if len(x) and x.max() > maxvalx: maxvalx = x.max()
             histarray[ievent].SetLineColor(ievent+1)
             histarray[ievent].SetFillColor(ievent+1)
             histarray[ievent].SetFillStyle(3003+ievent)
@@ -368,7 +466,9 @@ def meaninterval(dataset_index_sub, dataarray, comparisonlist,timewindow,name):
         canvas.Close()
 
 # saves a histogram with the events specified in  plotted
-def npeaksspecific(dataset_index_sub, dataarray, comparisonlist,name):
+def npeaksspecific(dataset_index_sub, store, comparisonlist,name):
+    rootsetup()
+    from ROOT import TCanvas, TH1F, TLegend
     for ikey in comparisonlist.keys():
         canvas = TCanvas("c", "Count of peaks per respondent", 1200, 800)
         canvas.cd()
@@ -394,30 +494,24 @@ def npeaksspecific(dataset_index_sub, dataarray, comparisonlist,name):
         for event in comparisonlist[ikey]:
             for respondent in dataset_index_sub:
                 try:
-                    test = dataarray.dropna(axis=0).loc[respondent]
+                    respdataarray = store.series(respondent)
                 except Exception:
-                    print >> f, '\n failed with respondent: '+respondent+' and name/key: '+ name+'/'+ikey
-                    pass
-                if(event == '01_Indledning.avi'):
-                    test1 = len(dataarray.dropna(axis=0).loc[respondent])
-                respdataarray = dataarray.dropna(axis=0).loc[respondent]
+                    print >> state.log, '\n failed with respondent: '+respondent+' and name/key: '+ name+'/'+ikey
+                    raise
                 hist = TH1F(str(respondent) + "hist", str(respondent) + "hist",
                             int((respdataarray.index[-1]-respdataarray.index[0])*binscale),
                             respdataarray.index[0], respdataarray.index[-1])
-                for i in range(0, len(respdataarray) - 1):
-                    hist.Fill(respdataarray.index[i], respdataarray.values[i])
-                for clipindex in range(0, len(EventBinsPos[respondent]) - 1):
-                    if EventBinsNames[respondent][clipindex] != event: continue
-                    if (clipindex % 2 == 0):
-                        s = TSpectrum()
-                        #canvas1 = TCanvas("c1", "Count of peaks per respondent", 1200, 800)
-                        #canvas1.cd()
-                        hist.GetXaxis().SetRangeUser(EventBinsPos[respondent][clipindex],EventBinsPos[respondent][clipindex + 1])
-                        #hist.Draw()
-                        #canvas1.Update()
-                        np = s.Search(hist, sigmapeaksinterval, "noMarkov same", peakamplitude)
-                        histarray[ievent].Fill(np)
-                        #canvas1.Delete()
+                fill(hist, respdataarray.index.values[:-1], respdataarray.values[:-1])
+                events = state.event_indices[respondent]
+                for clip in events.clips(event):
+                    #canvas1 = TCanvas("c1", "Count of peaks per respondent", 1200, 800)
+                    #canvas1.cd()
+                    hist.GetXaxis().SetRangeUser(events.starts[clip], events.stops[clip])
+                    #hist.Draw()
+                    #canvas1.Update()
+                    peaksx, bg = findpeaks(hist, withbackground=False)
+                    histarray[ievent].Fill(len(peaksx))
+                    #canvas1.Delete()
             canvas.cd()
             histarray[ievent].Draw("same")
             histarray[ievent].SetLineColor(ievent+1)
@@ -451,7 +545,9 @@ def npeaksspecific(dataset_index_sub, dataarray, comparisonlist,name):
         canvas.Close()
 
 # saves a histogram with the events specified in comparisonlist plotted
-def npeaksspecificminutes(dataset_index_sub, dataarray, comparisonlist,timewindow,name):
+def npeaksspecificminutes(dataset_index_sub, store, comparisonlist,timewindow,name):
+    rootsetup()
+    from ROOT import TCanvas, TH1F, TLegend
     timeinterval=12000 # total of 12000/60 = 200 minutes now - corrected later on
     histtonicfull = TH1F("tonicsperminfull", "Tonic Component", (timeinterval + timewindow) / timewindow, 0,
                           timeinterval)
@@ -472,6 +568,20 @@ def npeaksspecificminutes(dataset_index_sub, dataarray, comparisonlist,timewindo
     histpeaksfull.GetYaxis().SetTitleOffset(1.4)
     histpeaksfull.SetStats(False)
 
+    # peaks, tonic and phasic component of every clip of the compared events, per respondent in parallel
+    allevents = set(event for ikey in comparisonlist.keys() for event in comparisonlist[ikey])
+    jobs, clipnumbers = list(), list()
+    for respondent in dataset_index_sub:
+        events = state.event_indices[respondent]
+        clips = sorted(set(clip for event in allevents for clip in events.clips(event)))
+        syncpos, values = store.valid(respondent)
+        jobs.append((syncpos, values, [(events.starts[clip] + (1/binscale), events.stops[clip] - (1/binscale), 'clip')
+                                       for clip in clips]))
+        clipnumbers.append(clips)
+    results = extractpartials('clips' + name, dataset_index_sub, jobs)
+    extracted = dict((respondent, dict(zip(clips, windows)))
+                     for respondent, clips, windows in zip(dataset_index_sub, clipnumbers, results))
+
     for ikey in comparisonlist.keys():
         canvas = TCanvas("c", "Count of peaks per respondent", 1200, 800)
         canvas.cd()
@@ -512,44 +622,16 @@ def npeaksspecificminutes(dataset_index_sub, dataarray, comparisonlist,timewindo
 
         for event in comparisonlist[ikey]:
             for respondent in dataset_index_sub:
-                respdataarray = dataarray.dropna(axis=0).loc[respondent]
-
-                for clipindex in range(0, len(EventBinsNames[respondent]) - 1):
-                    if EventBinsNames[respondent][clipindex] != event: continue
-                    if (clipindex % 2 == 0):
-                        canvas1 = TCanvas("c1", "Count of peaks per respondent", 1200, 800)
-                        canvas1.cd()
-                        s = TSpectrum()
-                        hist = TH1F("hist" + respondent+event, "hist" + respondent + event,
-                                    int(len(respdataarray.index)/20),
-                                    respdataarray.index[0], respdataarray.index[-1])
-                        a = EventBinsPos[respondent][clipindex] + (1/binscale)
-                        b = EventBinsPos[respondent][clipindex + 1] - (1/binscale)
-                        nbins = (hist.FindBin(b)-hist.FindBin(a))
-                        #phasic = TH1F("histphasic" + respondent + event, "hist" + respondent + event,0,b-a, nbins)
-                        for i in range(0, len(respdataarray) - 1):
-                            hist.Fill(respdataarray.index[i], respdataarray.values[i])
-                            #if respdataarray.index[i]>= a:
-                                #if respdataarray.index[i]<=b:
-                                    #phasic.Fill(respdataarray.index[i], respdataarray.values[i])
-                        hist.GetXaxis().SetRangeUser(a, b)
-                        if(hist.Integral(hist.FindBin(a), hist.FindBin(b)!=0)):
-                            hist.Scale(1./hist.Integral(hist.FindBin(a), hist.FindBin(b)))
-                        #phasic.GetXaxis().SetRangeUser(a, b)
-                        hist.Draw()
-                        canvas1.Update()
-                        npeaks = s.Search(hist, sigmapeaksinterval, "noMarkov same", peakamplitude)
-                        bg = s.Background(hist, 20, "Compton same")
-                        canvas1.Update()
-                        hist.Add(bg,-1)
-                        for x in range(0,npeaks):
-                            peakx = s.GetPositionX()[x]-a
-                            peakarray[ievent].Fill(peakx*binscale,npeaks)
-                            if((b-a)*binscale>maxvalx): maxvalx = (b-a)*binscale
-                        for ibin in range(bg.FindBin(a),bg.FindBin(b)):
-                            binx = bg.GetBinCenter(ibin)-a
-                            tonicarray[ievent].Fill(binx*binscale,bg.GetBinContent(ibin))
-                            phasicarray[ievent].Fill(binx*binscale,hist.GetBinContent(ibin))
+                events = state.event_indices[respondent]
+                for clip in events.clips(event):
+                    a = events.starts[clip] + (1/binscale)
+                    b = events.stops[clip] - (1/binscale)
+                    peakx, binx, tonic, phasic = extracted[respondent][clip]
+                    npeaks = len(peakx)
+                    fill(peakarray[ievent], peakx*binscale, np.repeat(float(npeaks), npeaks))
+                    if npeaks > 0 and (b-a)*binscale>maxvalx: maxvalx = (b-a)*binscale
+                    fill(tonicarray[ievent], binx*binscale, tonic)
+                    fill(phasicarray[ievent], binx*binscale, phasic)
             canvas.cd()
             peakarray[ievent].SetLineColor(ievent+1)
             peakarray[ievent].SetFillColor(ievent+1)
@@ -612,7 +694,9 @@ def npeaksspecificminutes(dataset_index_sub, dataarray, comparisonlist,timewindo
         canvas.Close()
 
 
-def createplotsFullRange(dataset_index_sub, dataarray,timewindow,name):
+def createplotsFullRange(dataset_index_sub, store,timewindow,name):
+    rootsetup()
+    from ROOT import TCanvas, TH1F
     timeinterval=12000 # total of 12000/60 = 200 minutes now - corrected later on
     histtonicfull = TH1F("tonicsperminfull", "Tonic per respondent", (timeinterval + timewindow) / timewindow, 0,
                           timeinterval)
@@ -635,34 +719,22 @@ def createplotsFullRange(dataset_index_sub, dataarray,timewindow,name):
     canvas = TCanvas("c", "Sum over respondents", 1200, 800)
     maxvalx = 0
     maxvaly = 0
-    s = TSpectrum()
+    # peaks, tonic and phasic component of every respondent, in parallel
+    jobs = list()
     for respondent in dataset_index_sub:
-        canvas1 = TCanvas("c1", "Count of peaks per respondent", 1200, 800)
-        canvas1.cd()
-        respdataarray = dataarray.dropna(axis=0).loc[respondent]
-        hist = TH1F("hist" + respondent, "hist" + respondent,
-                                    int(len(respdataarray.index)/20),
-                                    respdataarray.index[0], respdataarray.index[-1])
-        a = EventBinsPos[respondent][0] + (1/binscale)
-        b = EventBinsPos[respondent][len(EventBinsPos[respondent])-1] - (1/binscale)
-        for i in range(0, len(respdataarray) - 1):
-            hist.Fill(respdataarray.index[i], respdataarray.values[i])
-        hist.GetXaxis().SetRangeUser(a, b)
-        hist.Scale(1./hist.Integral())
-        hist.Draw()
-        canvas1.Update()
-        npeaks = s.Search(hist, sigmapeaksinterval, "noMarkov same", peakamplitude)
-        bg = s.Background(hist, 20, "Compton same")
-        canvas1.Update()
-        hist.Add(bg,-1)
-        for x in range(0,npeaks):
-            peakx = s.GetPositionX()[x]-a
-            histpeaksfull.Fill(peakx*binscale,npeaks)
-            if((b-a)*binscale>maxvalx): maxvalx = (b-a)*binscale
-        for ibin in range(bg.FindBin(a),bg.FindBin(b)):
-            binx = bg.GetBinCenter(ibin)-a
-            histtonicfull.Fill(binx*binscale,bg.GetBinContent(ibin))
-            histphasicfull.Fill(binx*binscale,hist.GetBinContent(ibin))
+        syncpos, values = store.valid(respondent)
+        a = state.event_indices[respondent].first + (1/binscale)
+        b = state.event_indices[respondent].last - (1/binscale)
+        jobs.append((syncpos, values, [(a, b, 'range')]))
+    results = extractpartials('fullrange' + name, dataset_index_sub, jobs)
+    for (syncpos, values, windows), extracted in zip(jobs, results):
+        a, b, scaling = windows[0]
+        peakx, binx, tonic, phasic = extracted[0]
+        npeaks = len(peakx)
+        fill(histpeaksfull, peakx*binscale, np.repeat(float(npeaks), npeaks))
+        if npeaks > 0 and (b-a)*binscale>maxvalx: maxvalx = (b-a)*binscale
+        fill(histtonicfull, binx*binscale, tonic)
+        fill(histphasicfull, binx*binscale, phasic)
     #canvas.cd()
     # histpeaksfull.SetLineColor(1)
     # histpeaksfull.SetFillColor(1)
@@ -705,573 +777,413 @@ def createplotsFullRange(dataset_index_sub, dataarray,timewindow,name):
     canvas.SaveAs('../out/results/timedistributionof_tonic' + name + 'overview' + '.png')
     canvas.Close()
 
-def phasic_component(dataset_index_sub, dataarray, window):
-    values = list()
-
-    for p in dataset_index_sub:
-        tonic_temp = (pd.rolling_mean(dataarray.loc[p], window))
-
-        returndata1 = abs(((pd.Series.subtract(tonic_temp, dataarray.loc[p])) * (
-            -1.0)))  # ABS: Negative peaks transformed into positive peaks
-
-        values.extend(returndata1.tolist())
-
-    returndata = pd.Series(values, index=dataarray.index)
-
-    return (returndata)
-
-
-def tonic_component(dataset_index_sub, dataarray, window):
-    values = list()
-
-    for p in dataset_index_sub:
-        tonic_temp = (pd.rolling_mean(dataarray.loc[p], window))
-        values.extend(tonic_temp)
-
-    return pd.Series(values, index=dataarray.index)
-
-
-def normalize_series(dataset_index_sub, dataseries):
-    values = list()
-
-    for p in dataset_index_sub:
-        dataseries1 = (
-            (dataseries.loc[p] - dataseries.loc[p].min()) / (dataseries.loc[p].max() - dataseries.loc[p].min()))
-        values.extend(dataseries1.tolist())
-
-    return pd.Series(values, index=dataseries.index)
-
-
-def event_hz_pointers(files, events, event_data_sub, sync_pos_sub):
-    fhandle = open(folder_path + files, 'r')
-
-    n = 0
-    event_temp_list = list()
-    event_hz_markers = list()
-    previous = ""
-
-    for p in fhandle:
-
-        p1 = p.split(delimiter)
-        value_to_add = 0
-        if n == 0:
-            label_lookup_event = p1.index(event_data_sub)
-            label_lookup_position = p1.index(sync_pos_sub)
-
-        if n != 0:
-            if len(p1) < label_lookup_event:
-                print >> f, "Error. Unknown error occured when slicing events from dataset"
-                print >> f, "A discrepancy between lenght of dataset and event position. Event position exceeded the lenght of dataset."
-                print >> f, "Lenght of dataset: ", len(p1)
-                print >> f, "Event label position: ", label_lookup_event
-                print >> f, "track back error halts script from continuing."
-            #print len(p1)
-            #print files
-            if p1[label_lookup_event] in events:
-                event_temp_list.append(p1[label_lookup_event])
-
-                try:
-                    value_to_add = int((p1[label_lookup_position]))
-                except:
-                    print >> f, "Error. Blank cell or string data detected where integer data was expected."
-                    print >> f, "This will result in failure to slice events. Dataset should be corrected before continuing"
-                    print >> f, "Stop script execution and remove or correct dataset."
-                #Add a buffer to the end of the sequence to catch EDA reactions with delay.
-                if(p1[label_lookup_event]==previous):
-                    event_hz_markers.append(value_to_add+endbuffer)
-                else:
-                    event_hz_markers.append(value_to_add)
-                previous = p1[label_lookup_event]
-        n = n + 1
-
-    fhandle.close()
-
-    event_temp_list1, event_hz_markers = (list(x) for x in
-                                         zip(*sorted(zip(event_temp_list, event_hz_markers), key=lambda pair: pair[0])))
-
-    return (event_temp_list, event_hz_markers)
-
-
-def eventmeans(name, sub_event_names, sub_event_datapoints, df):
+def eventmeans(name, events, df):
     temp_mean = list()
     temp_std = list()
 
-    number_of_events = len(sub_event_names)
-    n = 0
+    respondent_df = df.loc[name]
+    for clip in range(0, len(events)):
+        get_slice_start = int(events.starts[clip])
+        get_slice_stop = int(events.stops[clip])
 
-    while n < number_of_events:
-        get_slice_start = int(sub_event_datapoints[n])
-        get_slice_stop = int(sub_event_datapoints[n + 1])
-
-        event_arousal_mean = df.loc[name].loc[get_slice_start:get_slice_stop].mean()
-        event_arousal_std = df.loc[name].loc[get_slice_start:get_slice_stop].std()
+        event_arousal_mean = respondent_df.loc[get_slice_start:get_slice_stop].mean()
+        event_arousal_std = respondent_df.loc[get_slice_start:get_slice_stop].std()
 
         temp_mean.append(event_arousal_mean.values)
         temp_std.append(event_arousal_std.values)
 
-        n = n + 2
-
     return (temp_mean, temp_std)
 
 
-def suplabel(axis, label, label_prop=None,
-             labelpad=5,
-             ha='center', va='center'):
-    ''' Add super ylabel or xlabel to the figure
-    Similar to matplotlib.suptitle
-    axis       - string: "x" or "y"
-    label      - string
-    label_prop - keyword dictionary for Text
-    labelpad   - padding from the axis (default: 5)
-    ha         - horizontal alignment (default: "center")
-    va         - vertical alignment (default: "center")
-    '''
-    fig = plt.gcf()
-    xmin = []
-    ymin = []
-    for ax in fig.axes:
-        xmin.append(ax.get_position().xmin)
-        ymin.append(ax.get_position().ymin)
-    xmin, ymin = min(xmin), min(ymin)
-    dpi = fig.dpi
-    if axis.lower() == "y":
-        rotation = 90.
-        x = xmin - float(labelpad) / dpi
-        y = 0.5
-    elif axis.lower() == 'x':
-        rotation = 0.
-        x = 0.5
-        y = ymin - float(labelpad) / dpi
-    else:
-        raise Exception("Unexpected axis: x or y")
-    if label_prop is None:
-        label_prop = dict()
-    plt.text(x, y, label, rotation=rotation,
-             transform=fig.transFigure,
-             ha=ha, va=va,
-             **label_prop)
-
-
 ### PROGRAM ###
-
-print >> f, "Script to perform automated data analysis."
-print >> f, "Jacob Lyng Wieland, November/December 2015 - rewritten by Ask E. Loevschall-Jensen 2016"
-print >> f, "---------------------------------------------------------------------------"
-print >> f, "Each dataset will now be read..."
-
-
-
-
-
-# Initialize global lists
-index1_names = list()
-index2_syncpos = list()
-eda_values_list = list()
-pupil_diameter_values_list = list()
-filelist = list()
-dataset_index = list()
-dataset_event_names = list()
-dataset_event_datapoints = list()
-EventBinsPos = {}
-EventBinsNames = {}
-
-
-# Walk through folder creating file list
-for roots, dirs, files in os.walk(folder_path):
-    for files_to_compute in files:
-        if files_to_compute.endswith(filename_ext):
-            filelist.append(files_to_compute)
-print >> f, "Number of datasets to compute: ", len(filelist)
-
-# Extract data from files
-for masterfile in filelist:
-    print >> f, "Processing dataset: ", masterfile
-    index_list = dataextract(masterfile, sync_pos)
-    eda_data_list = dataextract(masterfile, eda_data)
-    pupil_data_array = []
-    pupil_data_list = []
-    for i in range(0,len(pupil_data)):
-        pupil_data_array.append(dataextract(masterfile, pupil_data[i]))
-    for i in range(0,len(pupil_data_array[0])):
-        pupil_data_list.append((pupil_data_array[0][i] + pupil_data_array[1][i])/2.0)
-
-    event_names, event_datapoints = event_hz_pointers(masterfile, Events_list, event_data,
-                                                      sync_pos)  # syntax: file, list of events to look for, data tag in data set describing events, sync positions, delimiter
-    id_name = (masterfile.split('.'))[0]
-
-    if len(index_list) != len(eda_data_list):
-        "WARNING! in file", id_name, " a difference between index lenght and value lenght has been encounted."
-    if len(index_list) != len(pupil_data_list):
-        "WARNING! in file", id_name, " a difference between index lenght and pupil diameter lenght has been encounted."
-    n1 = 0
-    id_name_list = list()
-
-    while (len(index_list)) > n1:
-        id_name_list.append(id_name)
-        n1 = n1 + 1
-
-    # Clean data focusing solely on defined events. Other data = NaN.
-
-    xn = 0
-    xn1 = 0
-    xn2 = 0
-
-    eda_data1 = list()
-    pupil_data1 = list()
-    event_hz_markers1 = event_datapoints
-    event_hz_markers1.sort()
-
-    for xp in index_list:
-
-        if len(event_hz_markers1) != xn and event_hz_markers1[xn] == xp:
-            # Switching - when in event data array add data otherwise add numpy.nan
-            xn = xn + 1
-            xn1 = 0 if xn1 else 1
-
-        if xn1 == 0:
-            eda_data1.append(np.nan)  # Fill NaN when outside event boundaries
-            pupil_data1.append(np.nan)
-
-        elif xn1 == 1:
-            eda_data1.append(eda_data_list[xn2])
-            pupil_data1.append(pupil_data_list[xn2])
-
-        xn2 = xn2 + 1
-
-    # All data are extended to three lists, essentially creating a MultiIndex (index1+2) and referring values
-    index1_names.extend(id_name_list)
-    index2_syncpos.extend(index_list)
-    eda_values_list.extend(eda_data1)
-    pupil_diameter_values_list.extend(pupil_data1)
-
-    # This list keeps track of all data sets in order to compute event means
-    dataset_index.append(id_name)
-    dataset_event_names.append(event_names)
-    dataset_event_datapoints.append(event_datapoints)
-    EventBinsPos[id_name] = event_datapoints
-    EventBinsNames[id_name] = event_names
-
-print >> f, "Creating dataframe..."
-# Make MultiIndex a Tuple zipping two lists together
-index3 = list(zip(index1_names, index2_syncpos))
-
-# Create 2D MultiIndex
-index4 = pd.MultiIndex.from_tuples(index3, names=['Names', 'Syncpos'])
-
-# Parse the Index to create a new dataframe named DF
-df = pd.DataFrame(index=index4)
-
-# Create a new series with the original data
-eda_data_series = pd.Series(eda_values_list, index=index4)
-pupil_data_series = pd.Series(pupil_diameter_values_list, index=index4)
-
-print >> f, eda_data_series.dropna(axis=0)
-# Tonic/phasic computations
-# Window size = number of datapoint!
-
-print >> f, "Computing number of peaks in time-window"
-
-rootfile = TFile(os.path.join(os.getcwd(), '../out/rootfiles/histos.root'), "RECREATE")
-
-if(peakseda):
-    ################ find peaks, phasic and tonic distributions in the data ######################
-    ################ all distributions are normalised to  integral 1 #############################
-    peaksperminute_full_range = npeaks(dataset_index, eda_data_series,'EDA')
-    #peaksperminute_full_range.GetXaxis().SetTitle('Time [minutes]')
-    peaksperminute_full_range.GetYaxis().SetTitle('Peaks per sequence')
-    peaksperminute_full_range.GetYaxis().SetTitleOffset(1.4)
-    peaksperminute_full_range.SetStats(False)
-    peaksperminute_full_range.SetFillStyle(3002)
-    peaksperminute_full_range.Write()
-    c = TCanvas("c", "c", 1200, 800)
-    c.cd()
-    peaksperminute_full_range.Draw()
-    c.Update()
-    c.SaveAs(os.path.join(os.getcwd(), '../out/results/EDApeaksperseq_full_range.png'))
-
-if(peakspd):
-    peaksperminute_full_range_PD = npeaks(dataset_index, pupil_data_series,'PD')
-    #peaksperminute_full_range_PD.GetXaxis().SetTitle('Time [minutes]')
-    peaksperminute_full_range_PD.GetYaxis().SetTitle('Peaks per sequence')
-    peaksperminute_full_range_PD.GetYaxis().SetTitleOffset(1.4)
-    peaksperminute_full_range_PD.SetStats(False)
-    peaksperminute_full_range_PD.SetFillStyle(3002)
-    peaksperminute_full_range_PD.Write()
-    c = TCanvas("c", "c", 1200, 800)
-    c.cd()
-    peaksperminute_full_range_PD.Draw()
-    c.Update()
-    c.SaveAs(os.path.join(os.getcwd(), '../out/results/PDpeaksperseq_full_range.png'))
-
-
-
-fontP = FontProperties()
-fontP.set_size('small')
+# Only run the analysis when the script is executed - the ingest worker processes import this module as well.
+if __name__ == '__main__':
+
+    # output to file:
+    # f = open(os.path.join(os.getcwd(), '../out/output.txt'), 'w')
+    f = open('../out/output.txt', 'w')
+    rootsetup()
+    from ROOT import TCanvas, TFile, TH1F
+    state = RunState(f)
+
+    print >> f, "Script to perform automated data analysis."
+    print >> f, "Jacob Lyng Wieland, November/December 2015 - rewritten by Ask E. Loevschall-Jensen 2016"
+    print >> f, "---------------------------------------------------------------------------"
+    print >> f, "Each dataset will now be read..."
+
+
+
+
+
+    # Initialize global lists - one array per respondent
+    syncpos_arrays = list()
+    eda_arrays = list()
+    pupil_diameter_arrays = list()
+    filelist = list()
+    dataset_index = list()
+    dataset_event_datapoints = list()
+
+
+    # Walk through folder creating file list
+    for roots, dirs, files in os.walk(folder_path):
+        for files_to_compute in files:
+            if files_to_compute.endswith(filename_ext):
+                filelist.append(files_to_compute)
+    print >> f, "Number of datasets to compute: ", len(filelist)
+
+    # Extract data from files - one pass over each file for all columns and the event markers (or none if it is in the
+    # cache already), spread over ingest_workers processes
+    # respondents arrive one at a time in file order; with ondiskstore each is written to the store and dropped before
+    # the next one is taken, so only the respondents being parsed are held in memory
+    respondents = read_respondents([folder_path + masterfile for masterfile in filelist], ingest_workers, sync_pos,
+                                   eda_data, pupil_data, event_data, Events_list, delimiter, endbuffer, f,
+                                   cache_dir if usecache else None, incremental)
+    if ondiskstore:
+        writer = StoreWriter(store_dir, ['eda', 'pupil'])
+    for masterfile, parsed in izip(filelist, respondents):
+        index_list = parsed['position']
+        eda_data_list = parsed['eda']
+        pupil_data_list = parsed['pupil']
+        event_names = parsed['event_names']
+        event_datapoints = parsed['event_positions']
+        id_name = (masterfile.split('.'))[0]
+
+        if len(index_list) != len(eda_data_list):
+            "WARNING! in file", id_name, " a difference between index lenght and value lenght has been encounted."
+        if len(index_list) != len(pupil_data_list):
+            "WARNING! in file", id_name, " a difference between index lenght and pupil diameter lenght has been encounted."
+        # Clean data focusing solely on defined events. Other data = NaN.
+        event_datapoints.sort()
+        in_event = event_mask(index_list, event_datapoints)
+
+        # Sync positions and values are kept as one array per respondent, the MultiIndex is built from them below
+        eda_values = np.where(in_event, eda_data_list, np.nan)  # NaN when outside event boundaries
+        pupil_values = np.where(in_event, pupil_data_list, np.nan)
+        if ondiskstore:
+            writer.append(id_name, index_list, dict(eda=eda_values, pupil=pupil_values))
+        else:
+            syncpos_arrays.append(index_list)
+            eda_arrays.append(eda_values)
+            pupil_diameter_arrays.append(pupil_values)
+
+        # This list keeps track of all data sets in order to compute event means
+        dataset_index.append(id_name)
+        dataset_event_datapoints.append(event_datapoints)
+        state.add_respondent(id_name, folder_path + masterfile, parsed.get('digest'), event_names, event_datapoints,
+                             index_list)
+
+    print >> f, "Creating dataframe..."
+    # Respondent-partitioned stores of the signals - the analysis functions take their per-respondent views from these
+    if ondiskstore:
+        stores = writer.close()
+        eda_store, pupil_store = stores['eda'], stores['pupil']
+    else:
+        eda_store = SignalStore(dataset_index, syncpos_arrays, eda_arrays)
+        pupil_store = eda_store.like(np.concatenate(pupil_diameter_arrays))
+
+    if not ondiskstore:
+        # (not for the store on disk - the MultiIndex and series hold the whole cohort in memory)
+        import pandas as pd
+        # Create 2D MultiIndex from the respondent names and the arrays of sync positions
+        index4 = eda_store.index()
+
+        # Parse the Index to create a new dataframe named DF
+        df = pd.DataFrame(index=index4)
+
+        # Create a new series with the original data
+        eda_data_series = pd.Series(eda_store.values, index=index4)
+        pupil_data_series = pd.Series(pupil_store.values, index=index4)
+
+        print >> f, eda_data_series.dropna(axis=0)
+    # Tonic/phasic computations
+    # Window size = number of datapoint!
+
+    print >> f, "Computing number of peaks in time-window"
+
+    rootfile = TFile(os.path.join(os.getcwd(), '../out/rootfiles/histos.root'), "RECREATE")
+
+    if(peakseda):
+        ################ find peaks, phasic and tonic distributions in the data ######################
+        ################ all distributions are normalised to  integral 1 #############################
+        peaksperminute_full_range = npeaks(dataset_index, eda_store,'EDA')
+        #peaksperminute_full_range.GetXaxis().SetTitle('Time [minutes]')
+        peaksperminute_full_range.GetYaxis().SetTitle('Peaks per sequence')
+        peaksperminute_full_range.GetYaxis().SetTitleOffset(1.4)
+        peaksperminute_full_range.SetStats(False)
+        peaksperminute_full_range.SetFillStyle(3002)
+        peaksperminute_full_range.Write()
+        c = TCanvas("c", "c", 1200, 800)
+        c.cd()
+        peaksperminute_full_range.Draw()
+        c.Update()
+        c.SaveAs(os.path.join(os.getcwd(), '../out/results/EDApeaksperseq_full_range.png'))
+
+    if(peakspd):
+        peaksperminute_full_range_PD = npeaks(dataset_index, pupil_store,'PD')
+        #peaksperminute_full_range_PD.GetXaxis().SetTitle('Time [minutes]')
+        peaksperminute_full_range_PD.GetYaxis().SetTitle('Peaks per sequence')
+        peaksperminute_full_range_PD.GetYaxis().SetTitleOffset(1.4)
+        peaksperminute_full_range_PD.SetStats(False)
+        peaksperminute_full_range_PD.SetFillStyle(3002)
+        peaksperminute_full_range_PD.Write()
+        c = TCanvas("c", "c", 1200, 800)
+        c.cd()
+        peaksperminute_full_range_PD.Draw()
+        c.Update()
+        c.SaveAs(os.path.join(os.getcwd(), '../out/results/PDpeaksperseq_full_range.png'))
+
+
+
+    ### Create comparision plots for eda and/or PD data for sequences in Comparison_list
+    if(rawedapeaks):
+        # plot specific events in same hist
+        #npeaksseqtotal= npeaksspecific(dataset_index, eda_store, Comparison_list,'rawEDApeaks')
+        #npeaksseqminuts = npeaksspecificminutes(dataset_index, eda_store, Comparison_list,timewindow,'rawEDApeaks')
+        npeaksfullrange = createplotsFullRange(dataset_index, eda_store,timewindow,'rawEDApeaks')
+
+    if(rawpdpeaks):
+        #npeaksseqtotal= npeaksspecific(dataset_index, pupil_store, Comparison_list,'rawPDpeaks')
+        #npeaksseqminuts = npeaksspecificminutes(dataset_index, pupil_store, Comparison_list,timewindow,'rawPDpeaks')
+        npeaksfullrange = createplotsFullRange(dataset_index, pupil_store,timewindow,'rawPDpeaks')
 
 
-### Create comparision plots for eda and/or PD data for sequences in Comparison_list
-if(rawedapeaks):
-    # plot specific events in same hist
-    #npeaksseqtotal= npeaksspecific(dataset_index, eda_data_series, Comparison_list,'rawEDApeaks')
-    #npeaksseqminuts = npeaksspecificminutes(dataset_index, eda_data_series, Comparison_list,timewindow,'rawEDApeaks')
-    npeaksfullrange = createplotsFullRange(dataset_index, eda_data_series,timewindow,'rawEDApeaks')
-
-if(rawpdpeaks):
-    #npeaksseqtotal= npeaksspecific(dataset_index, pupil_data_series, Comparison_list,'rawPDpeaks')
-    #npeaksseqminuts = npeaksspecificminutes(dataset_index, pupil_data_series, Comparison_list,timewindow,'rawPDpeaks')
-    npeaksfullrange = createplotsFullRange(dataset_index, pupil_data_series,timewindow,'rawPDpeaks')
-
-
-###########################################################################
-###########################################################################
-
-# peaksinwindow_series1 = npeaks(dataset_index, eda_data_series)
-
-
-# a plot peaks in the full datarange in 1 minute bins summed over all respondents.
-# peaksperminute_full_range = TH1F("peaksperminute_full_range", "Peaks per minute with 4 #sigma significance",
-#                                 len(peaksinwindow_series1), 0, len(peaksinwindow_series1))
-
-# plot peaks for the full datarange and for events defined in Comparison_list
-# for i in range(0, len(peaksinwindow_series1)):
-#    peaksperminute_full_range.Fill(i, peaksinwindow_series1.values[i])
-# eda_data_series.dropna(axis=0).loc['02418'].index[-1] = 2.629.585
-# for event in Comparison_list:
-#    for pos in range(int(EventBinsDict['start_'+event]/(1000. * 60.)),int(EventBinsDict['end_'+event]/(1000. * 60.))):
-#        int(EventBinsDict['start_MF vaccine med case.avi'] / (1000. * 60.))
-
-# For specific events of interest in same histogram
-# peaksperminute_compared = TH1F("peaksperminute_compared", "Peaks per minute with 4 #sigma significance",
-#                               len(peaksinwindow_series1), 0, len(peaksinwindow_series1))
-
-
-####################### find phasic component of EDA ######################
-###########################################################################
-# timescale for plots
-timescaling = 1 / (1000. * 1)  #
-
-if dooverview:
-    print >> f, "Computing phasic component of data..."
-    phasic_data_series = phasic_component(dataset_index, eda_data_series, rolling_average_window)
-    tonic_data_series = tonic_component(dataset_index, eda_data_series, rolling_average_window)
-    # print >> f, phasic_data_series.dropna(axis=0)
-    # t=phasic_data_series.index
-    for respondent in dataset_index:
-        # plot raw EDA for first case:
-        tmpraw = eda_data_series.dropna(axis=0).loc[respondent]
-        tmptonic = tonic_data_series.dropna(axis=0).loc[respondent]
-        # Two subplots, the axes array is 1-d
-        sp1 = plt.subplot(2, 1, 1)
-        plt.plot(tmpraw.index * timescaling, tmpraw.values, label='Raw EDA')
-        plt.plot(tmptonic.index * timescaling, tmptonic.values, label='tonic (time avaraged EDA)')
-        sp1.set_title(respondent)
-        # plt.ylabel('Scin conductance (EDA)')
-        plt.legend(bbox_to_anchor=(1.1, 1.2), prop=fontP)
-        # phasic part
-        plt.subplot(2, 1, 2)
-        tmpphasic = phasic_data_series.dropna(axis=0).loc[respondent]
-        plt.plot(tmpphasic.index * timescaling, tmpphasic.values,
-                 label='phasic rest after subtraction of tonic time avarage')
-        plt.legend(bbox_to_anchor=(1.1, 0.15), prop=fontP)
-        plt.grid(True)
-        plt.xlabel('time [s]')
-        suplabel('y', 'Skin conductance (EDA)')
-        plt.savefig("../out/respondents/" + respondent + ".png")
-        plt.close()
-        # plt.show()
-
-# Normalize series output
-print >> f, "Normalizing phasic data..."
-raw_normalized = normalize_series(dataset_index, eda_data_series)
-# phasic_outlier_cleaned = noisereduce(dataset_index, eda_data_series)
-
-# timeindex = []
-# for index in range[1:len(eda_data_series)]:
-#     timeindex.append[time.strftime('%H:%M:%S', time.gmtime(eda_data_series.index[index]))]
-
-
-if (meanraw):
-    ######################### mean EDA on normalized EDA #########################
-    ##############################################################################
-    #find mean eda for each sequence
-    meaneda_full_range = meaneda(dataset_index, raw_normalized)
-    meaneda_full_range.GetYaxis().SetTitle('Mean EDA per sequence')
-    meaneda_full_range.GetYaxis().SetTitleOffset(1.4)
-    meaneda_full_range.SetStats(False)
-    #meaneda_full_range.Write()
-    c = TCanvas("c", "c", 1200, 800)
-    c.cd()
-    meaneda_full_range.Draw()
-    c.Update()
-    c.SaveAs(os.path.join(os.getcwd(), '../out/results/meaneda_full_range.png'))
-
-    # find mean per interval for each sequence - histogram as for peaks
-    meanedainterval = meaninterval(dataset_index, raw_normalized,Comparison_list,timewindow,'rawmean')
-    #meanedainterval.GetYaxis().SetTitle('Mean EDA per timeinterval')
-    #meanedainterval.GetYaxis().SetTitleOffset(1.4)
-    #meanedainterval.SetStats(False)
-    #meaneda_full_range.Write()
-    #c = TCanvas("c", "c", 1200, 800)
-    #c.cd()
-    #meanedainterval.Draw()
-    #c.Update()
-    #c.SaveAs(os.path.join(os.getcwd(), '../out/results/meaneda_intervals.png'))
     ###########################################################################
     ###########################################################################
 
-if(phasic):
-    phasic_normalized = normalize_series(dataset_index, phasic_data_series)
-    ################ mean EDA based on phasic component of data ###############
-    ###########################################################################
-    #find mean eda for each sequence of phasic data
-    meanphasic_full_range = meaneda(dataset_index, phasic_normalized)
-    meanphasic_full_range.GetYaxis().SetTitle('Mean Phasic per sequence')
-    meanphasic_full_range.GetYaxis().SetTitleOffset(1.4)
-    meanphasic_full_range.SetStats(False)
-    #meaneda_full_range.Write()
-    c = TCanvas("c", "c", 1200, 800)
-    c.cd()
-    meanphasic_full_range.Draw()
-    c.Update()
-    c.SaveAs(os.path.join(os.getcwd(), '../out/results/meanphasic_full_range.png'))
-
-    # find phasic mean per interval for each sequence - histogram as for peaks
-    meanphasicinterval = meaninterval(dataset_index, phasic_normalized,Comparison_list,timewindow,'phasicmean')
-    #eanphasicinterval.GetYaxis().SetTitle('Mean Phasic per interval')
-    #meanphasicinterval.GetYaxis().SetTitleOffset(1.4)
-    #meanphasicinterval.SetStats(False)
-    #meaneda_full_range.Write()
-    #c = TCanvas("c", "c", 1200, 800)
-    #c.cd()
-    #meanphasicinterval.Draw()
-    #c.Update()
-    #c.SaveAs(os.path.join(os.getcwd(), '../out/results/meanphasic_intervals.png'))
-    ###########################################################################
-    ###########################################################################
+    # peaksinwindow_series1 = npeaks(dataset_index, eda_data_series)
 
 
-if(phasic):
-    ############################### peaks phasic ##############################
-    ###########################################################################
-    ##find and plot histograms for peaks in phasic data
-    npeaksseqphasic= npeaks(dataset_index, phasic_normalized,'phasicEDA')
-    npeaksseqphasic.GetYaxis().SetTitle('Peaks per sequence')
-    npeaksseqphasic.GetYaxis().SetTitleOffset(1.4)
-    npeaksseqphasic.SetStats(False)
-    npeaksseqphasic.SetFillStyle(3002)
-    c = TCanvas("c", "c", 1200, 800)
-    c.cd()
-    npeaksseqphasic.Draw()
-    c.Update()
-    c.SaveAs(os.path.join(os.getcwd(), '../out/results/peaksperseqphasic_full_range.png'))
-    #npeaksphasicseqtotal = npeaksspecific(dataset_index, phasic_normalized, Comparison_list,'phasicEDApeaks')
-    #npeaksphasicseqminuts = npeaksspecificminutes(dataset_index, phasic_normalized, Comparison_list,timewindow,'phasicEDApeaks')
+    # a plot peaks in the full datarange in 1 minute bins summed over all respondents.
+    # peaksperminute_full_range = TH1F("peaksperminute_full_range", "Peaks per minute with 4 #sigma significance",
+    #                                 len(peaksinwindow_series1), 0, len(peaksinwindow_series1))
 
-    ###########################################################################
-    ###########################################################################
+    # plot peaks for the full datarange and for events defined in Comparison_list
+    # for i in range(0, len(peaksinwindow_series1)):
+    #    peaksperminute_full_range.Fill(i, peaksinwindow_series1.values[i])
+    # eda_data_series.dropna(axis=0).loc['02418'].index[-1] = 2.629.585
+    # for event in Comparison_list:
+    #    for pos in range(int(EventBinsDict['start_'+event]/(1000. * 60.)),int(EventBinsDict['end_'+event]/(1000. * 60.))):
+    #        int(EventBinsDict['start_MF vaccine med case.avi'] / (1000. * 60.))
 
+    # For specific events of interest in same histogram
+    # peaksperminute_compared = TH1F("peaksperminute_compared", "Peaks per minute with 4 #sigma significance",
+    #                               len(peaksinwindow_series1), 0, len(peaksinwindow_series1))
 
 
-if dooverview:
-    phasic_data_series = phasic_component(dataset_index, eda_data_series, rolling_average_window)
-    phasic_normalized = normalize_series(dataset_index, phasic_data_series)
-    tonic_normalized = normalize_series(dataset_index, tonic_data_series)
-    ######################### test of individuals #########################
-    # plot normalized for short range
-    for respondent in dataset_index:
-        # plot raw EDA for first case:
-        tmpraw = raw_normalized.dropna(axis=0).loc[respondent]
-        tmptonic = tonic_normalized.dropna(axis=0).loc[respondent]
-        # Two subplots, the axes array is 1-d
-        sp1 = plt.subplot(2, 1, 1)
-        plt.plot(tmpraw.index[1000:3000] * timescaling, tmpraw.values[1000:3000], label='Normalized EDA')
-        plt.plot((tmptonic.index[1000:3000]) * timescaling, tmptonic.values[1000:3000],
-                 label='Normalized tonic (time avaraged EDA)')
-        sp1.set_title(respondent)
-        # plt.ylabel('Scin conductance (EDA)')
-        plt.legend(bbox_to_anchor=(1.1, 1.2), prop=fontP)
-        # phasic part
-        plt.subplot(2, 1, 2)
-        tmpphasic = phasic_normalized.dropna(axis=0).loc[respondent]
-        plt.plot(tmpphasic.index[1000:3000] * timescaling, tmpphasic.values[1000:3000], label='Normalized phasic EDA')
-        plt.legend(bbox_to_anchor=(1.1, 0.15), prop=fontP)
-        plt.grid(True)
-        plt.xlabel('time [s]')
-        suplabel('y', 'Normalized skin conductance (EDA)')
-        plt.savefig("../out/respondents/" + respondent + "_normalized.png")
-        plt.close()
-        # plt.show()
+    ####################### find phasic component of EDA ######################
+    ###########################################################################
+    # timescale for plots
+    timescaling = 1 / (1000. * 1)  #
+
+    if dooverview or phasic:
+        # tonic and phasic components are computed once here and shared by all plots below
+        print >> f, "Computing phasic component of data..."
+        tonic_store, phasic_store = tonic_phasic(eda_store, rolling_average_window)
+
+    if dooverview:
+        # print >> f, phasic_data_series.dropna(axis=0)
+        # t=phasic_data_series.index
+        for respondent in dataset_index:
+            # plot raw EDA for first case:
+            tmpraw = eda_store.series(respondent)
+            tmptonic = tonic_store.series(respondent)
+            tmpphasic = phasic_store.series(respondent)
+            # Two subplots: signal and tonic part, phasic part
+            state.plotspecs.append(PlotSpec('respondent', "../out/respondents/" + respondent + ".png", title=respondent,
+                                            xscale=timescaling, ylabel='Skin conductance (EDA)',
+                                            top=[(tmpraw.index.values, tmpraw.values, 'Raw EDA'),
+                                                 (tmptonic.index.values, tmptonic.values, 'tonic (time avaraged EDA)')],
+                                            bottom=[(tmpphasic.index.values, tmpphasic.values,
+                                                     'phasic rest after subtraction of tonic time avarage')]))
+
+    # Normalize series output
+    print >> f, "Normalizing phasic data..."
+    if dooverview or phasic:
+        raw_normalized, tonic_normalized, phasic_normalized = normalize([eda_store, tonic_store, phasic_store])
+    else:
+        raw_normalized, = normalize([eda_store])
+    # phasic_outlier_cleaned = noisereduce(dataset_index, eda_data_series)
+
+    # timeindex = []
+    # for index in range[1:len(eda_data_series)]:
+    #     timeindex.append[time.strftime('%H:%M:%S', time.gmtime(eda_data_series.index[index]))]
+
+
+    if (meanraw):
+        ######################### mean EDA on normalized EDA #########################
+        ##############################################################################
+        #find mean eda for each sequence
+        meaneda_full_range = meaneda(dataset_index, raw_normalized)
+        meaneda_full_range.GetYaxis().SetTitle('Mean EDA per sequence')
+        meaneda_full_range.GetYaxis().SetTitleOffset(1.4)
+        meaneda_full_range.SetStats(False)
+        #meaneda_full_range.Write()
+        c = TCanvas("c", "c", 1200, 800)
+        c.cd()
+        meaneda_full_range.Draw()
+        c.Update()
+        c.SaveAs(os.path.join(os.getcwd(), '../out/results/meaneda_full_range.png'))
+
+        # find mean per interval for each sequence - histogram as for peaks
+        meanedainterval = meaninterval(dataset_index, raw_normalized,Comparison_list,timewindow,'rawmean')
+        #meanedainterval.GetYaxis().SetTitle('Mean EDA per timeinterval')
+        #meanedainterval.GetYaxis().SetTitleOffset(1.4)
+        #meanedainterval.SetStats(False)
+        #meaneda_full_range.Write()
+        #c = TCanvas("c", "c", 1200, 800)
+        #c.cd()
+        #meanedainterval.Draw()
+        #c.Update()
+        #c.SaveAs(os.path.join(os.getcwd(), '../out/results/meaneda_intervals.png'))
+        ###########################################################################
+        ###########################################################################
+
+    if(phasic):
+        ################ mean EDA based on phasic component of data ###############
+        ###########################################################################
+        #find mean eda for each sequence of phasic data
+        meanphasic_full_range = meaneda(dataset_index, phasic_normalized)
+        meanphasic_full_range.GetYaxis().SetTitle('Mean Phasic per sequence')
+        meanphasic_full_range.GetYaxis().SetTitleOffset(1.4)
+        meanphasic_full_range.SetStats(False)
+        #meaneda_full_range.Write()
+        c = TCanvas("c", "c", 1200, 800)
+        c.cd()
+        meanphasic_full_range.Draw()
+        c.Update()
+        c.SaveAs(os.path.join(os.getcwd(), '../out/results/meanphasic_full_range.png'))
+
+        # find phasic mean per interval for each sequence - histogram as for peaks
+        meanphasicinterval = meaninterval(dataset_index, phasic_normalized,Comparison_list,timewindow,'phasicmean')
+        #eanphasicinterval.GetYaxis().SetTitle('Mean Phasic per interval')
+        #meanphasicinterval.GetYaxis().SetTitleOffset(1.4)
+        #meanphasicinterval.SetStats(False)
+        #meaneda_full_range.Write()
+        #c = TCanvas("c", "c", 1200, 800)
+        #c.cd()
+        #meanphasicinterval.Draw()
+        #c.Update()
+        #c.SaveAs(os.path.join(os.getcwd(), '../out/results/meanphasic_intervals.png'))
+        ###########################################################################
+        ###########################################################################
+
+
+    if(phasic):
+        ############################### peaks phasic ##############################
+        ###########################################################################
+        ##find and plot histograms for peaks in phasic data
+        npeaksseqphasic= npeaks(dataset_index, phasic_normalized,'phasicEDA')
+        npeaksseqphasic.GetYaxis().SetTitle('Peaks per sequence')
+        npeaksseqphasic.GetYaxis().SetTitleOffset(1.4)
+        npeaksseqphasic.SetStats(False)
+        npeaksseqphasic.SetFillStyle(3002)
+        c = TCanvas("c", "c", 1200, 800)
+        c.cd()
+        npeaksseqphasic.Draw()
+        c.Update()
+        c.SaveAs(os.path.join(os.getcwd(), '../out/results/peaksperseqphasic_full_range.png'))
+        #npeaksphasicseqtotal = npeaksspecific(dataset_index, phasic_normalized, Comparison_list,'phasicEDApeaks')
+        #npeaksphasicseqminuts = npeaksspecificminutes(dataset_index, phasic_normalized, Comparison_list,timewindow,'phasicEDApeaks')
+
+        ###########################################################################
+        ###########################################################################
+
+
+
+    if dooverview:
+        ######################### test of individuals #########################
+        # plot normalized for short range
+        for respondent in dataset_index:
+            # plot raw EDA for first case:
+            tmpraw = raw_normalized.series(respondent)
+            tmptonic = tonic_normalized.series(respondent)
+            tmpphasic = phasic_normalized.series(respondent)
+            # Two subplots: signal and tonic part, phasic part
+            state.plotspecs.append(PlotSpec('respondent', "../out/respondents/" + respondent + "_normalized.png",
+                                            title=respondent, xscale=timescaling,
+                                            ylabel='Normalized skin conductance (EDA)',
+                                            top=[(tmpraw.index.values[1000:3000], tmpraw.values[1000:3000],
+                                                  'Normalized EDA'),
+                                                 (tmptonic.index.values[1000:3000], tmptonic.values[1000:3000],
+                                                  'Normalized tonic (time avaraged EDA)')],
+                                            bottom=[(tmpphasic.index.values[1000:3000], tmpphasic.values[1000:3000],
+                                                     'Normalized phasic EDA')]))
 
-#
-# if(True):
-#     # add column to existing DataFrame:
-#     df[df.index[1], 'EDA'] = phasic_normalized
-#
-#     # Data validation: Test for equal number of events per dataset,
-#     print >> f, "Validating events for each dataset... Number of events and their names must be exactly the same across all datasets"
-#
-#     n = 0
-#     data_events_validating = len(dataset_index[0])
-#     while (len(dataset_index) - 1) > n:
-#         if (len(dataset_event_names[n])) != (len(dataset_event_names[n + 1])):
-#             print >> f, "DATA FAILURE... Unequal number of events detected!! Means may not be valid!"
-#
-#         n = n + 1
-#
-#     # Initalize new dataframe - dataframe for means #
-#     df1 = pd.DataFrame(index=dataset_event_names[0][0:(len(dataset_event_names[0])):2])
-#
-#     n = 0
-#
-#     for p in dataset_index:
-#         event_means, event_std = eventmeans(p, dataset_event_names[n], dataset_event_datapoints[n], df)
-#         n = n + 1
-#
-#         df1[p] = event_means
-#
-#     # Output event with arousal mean and standard deviation
-#     print >> f, "Output: event name, arousal mean for event and standard deviation for mean."
-#
-#     # asktodo - plot this:
-#     for p in dataset_event_names[0][0:(len(dataset_event_names[0])):2]:
-#         print >> f, p + "," + str((df1.loc[p].mean())[0]) + "," + str(df1.loc[p].std())
-#
-#     # Repeated Measures ANOVA
-#     print >> f, "Performing a repeated measures ANOVA..."
-#
-#     df_anova = pt.DataFrame()
-#
-#     headers = namedtuple('headers', ['subject', 'event', 'mean'])
-#
-#     an = 0
-#
-#     for p in dataset_event_names[0][0:(len(dataset_event_names[0])):2]:
-#
-#         for p1 in dataset_index:
-#             p2 = float(df1.loc[p].loc[p1])
-#             df_anova.insert(headers(p1, an, p2)._asdict())
-#
-#         an = an + 1
-#
-#     anova = df_anova.anova(dv='mean', sub='subject', wfactors=['event'])
-#
-#     print >> f, (anova)
-#
-#     # Concluding the script doing a T-test to test for sig. diff. means between two predefined means
-#     for ikey in Comparison_list.keys():
-#         t_test_list1 = list()
-#         t_test_list2 = list()
-#         print >> f, "Testing for significance between: " + Comparison_list[ikey][0] + " and " + Comparison_list[ikey][1]
-#         t_temp_list1 = df1.loc[ Comparison_list[ikey][0]].values
-#         t_temp_list2 = df1.loc[ Comparison_list[ikey][1]].values
-#
-#         for p in t_temp_list1:
-#             t_test_list1.append(float(p))
-#
-#         for p1 in t_temp_list2:
-#             t_test_list2.append(float(p1))
-#
-#         print >> f, ttest_ind(t_test_list1, t_test_list2)
+    #
+    # if(True):
+    #     # add column to existing DataFrame:
+    #     df[df.index[1], 'EDA'] = phasic_normalized
+    #
+    #     # Data validation: Test for equal number of events per dataset,
+    #     print >> f, "Validating events for each dataset... Number of events and their names must be exactly the same across all datasets"
+    #
+    #     n = 0
+    #     data_events_validating = len(dataset_index[0])
+    #     while (len(dataset_index) - 1) > n:
+    #         if (len(dataset_event_names[n])) != (len(dataset_event_names[n + 1])):
+    #             print >> f, "DATA FAILURE... Unequal number of events detected!! Means may not be valid!"
+    #
+    #         n = n + 1
+    #
+    #     # Initalize new dataframe - dataframe for means #
+    #     df1 = pd.DataFrame(index=dataset_event_names[0][0:(len(dataset_event_names[0])):2])
+    #
+    #     n = 0
+    #
+    #     for p in dataset_index:
+    #         event_means, event_std = eventmeans(p, EventIndices[p], df)
+    #         n = n + 1
+    #
+    #         df1[p] = event_means
+    #
+    #     # Output event with arousal mean and standard deviation
+    #     print >> f, "Output: event name, arousal mean for event and standard deviation for mean."
+    #
+    #     # asktodo - plot this:
+    #     for p in dataset_event_names[0][0:(len(dataset_event_names[0])):2]:
+    #         print >> f, p + "," + str((df1.loc[p].mean())[0]) + "," + str(df1.loc[p].std())
+    #
+    #     # Repeated Measures ANOVA
+    #     print >> f, "Performing a repeated measures ANOVA..."
+    #
+    #     df_anova = pt.DataFrame()
+    #
+    #     headers = namedtuple('headers', ['subject', 'event', 'mean'])
+    #
+    #     an = 0
+    #
+    #     for p in dataset_event_names[0][0:(len(dataset_event_names[0])):2]:
+    #
+    #         for p1 in dataset_index:
+    #             p2 = float(df1.loc[p].loc[p1])
+    #             df_anova.insert(headers(p1, an, p2)._asdict())
+    #
+    #         an = an + 1
+    #
+    #     anova = df_anova.anova(dv='mean', sub='subject', wfactors=['event'])
+    #
+    #     print >> f, (anova)
+    #
+    #     # Concluding the script doing a T-test to test for sig. diff. means between two predefined means
+    #     for ikey in Comparison_list.keys():
+    #         t_test_list1 = list()
+    #         t_test_list2 = list()
+    #         print >> f, "Testing for significance between: " + Comparison_list[ikey][0] + " and " + Comparison_list[ikey][1]
+    #         t_temp_list1 = df1.loc[ Comparison_list[ikey][0]].values
+    #         t_temp_list2 = df1.loc[ Comparison_list[ikey][1]].values
+    #
+    #         for p in t_temp_list1:
+    #             t_test_list1.append(float(p))
+    #
+    #         for p1 in t_temp_list2:
+    #             t_test_list2.append(float(p1))
+    #
+    #         print >> f, ttest_ind(t_test_list1, t_test_list2)
+
+    # draw the plots recorded above
+    print >> f, "Rendering plots..."
+    rendered, unchanged = render(state.plotspecs, render_workers, plot_manifest)
+    print >> f, str(rendered) + " plots rendered, " + str(unchanged) + " unchanged since the last run"
 
-rootfile.Write()
-rootfile.Close()
+    rootfile.Write()
+    rootfile.Close()
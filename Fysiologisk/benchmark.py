@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# coding=utf-8
+######## DR Audience Research ##############
+# Benchmarks of the analysis stages on synthetic respondents (32 ms sampling, EDA-like values) or on datafiles.
+# Run from the Fysiologisk folder:
+#   python benchmark.py multiindex [respondents] [samples per respondent]
+#   python benchmark.py meaninterval [respondents or datafile folder] [samples per respondent]
+#   python benchmark.py startup [repeats]
+# Each variant runs in a fresh python process, so the reported peak memory (RSS) belongs to that variant alone.
+# startup imports the modules of the analysis in fresh interpreters and reports the import time (the python 2 stand-in
+# for python -X importtime, which only python 3.7 on has) and which of the heavy libraries got imported with them -
+# none should be.
+# meaninterval runs on the datafiles of a folder when one is given (read with the settings in Fysiologisk.py), else on
+# synthetic respondents. It compares the former loop (a TH1F per interval - 'loop' where ROOT can be imported, else the
+# same masking with the mean taken in numpy, 'scan') with the prefix sums of means.interval_means.
+
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+def synthetic_respondents(nrespondents, nsamples, seed=0):
+    """Names, sync position arrays and EDA arrays (NaN outside a few events) of `nrespondents` respondents."""
+    rng = np.random.RandomState(seed)
+    names, syncpos, values = list(), list(), list()
+    for i in range(0, nrespondents):
+        names.append('%05d' % (i + 1))
+        syncpos.append(16952. + 32. * np.arange(nsamples))
+        eda = 10. + np.cumsum(rng.normal(0., 0.01, nsamples))
+        eda[rng.randint(0, 2, nsamples // 1000 + 1).repeat(1000)[:nsamples] == 0] = np.nan
+        values.append(eda)
+    return names, syncpos, values
+
+
+def synthetic_events(syncpos, nclips=10, nevents=5):
+    """EventIndex of `nclips` equally long clips (named 'event0'..) covering the sync positions `syncpos`."""
+    from events import EventIndex
+    markers = syncpos[np.linspace(0, len(syncpos) - 1, 2 * nclips).astype(np.int64)]
+    names = ['event%d' % ((marker // 2) % nevents) for marker in range(0, 2 * nclips)]
+    return EventIndex(names, markers, syncpos)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where the resource module is not available)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024. * 1024.) if sys.platform == 'darwin' else rss / 1024.
+
+
+def multiindex_variant(variant, nrespondents, nsamples):
+    import pandas as pd
+    from signalstore import respondent_index
+    names, syncpos, values = synthetic_respondents(nrespondents, nsamples)
+    baseline = peak_rss_mb()
+    start = time.time()
+    if variant == 'tuples':
+        # the former construction: python lists of names/positions/values zipped into tuples
+        index1_names, index2_syncpos, values_list = list(), list(), list()
+        for name, positions, eda in zip(names, syncpos, values):
+            index1_names.extend([name] * len(positions))
+            index2_syncpos.extend(positions)
+            values_list.extend(eda)
+        index = pd.MultiIndex.from_tuples(list(zip(index1_names, index2_syncpos)), names=['Names', 'Syncpos'])
+        series = pd.Series(values_list, index=index)
+    else:
+        series = pd.Series(np.concatenate(values), index=respondent_index(names, syncpos))
+    series.dropna().loc[names[-1]]
+    return time.time() - start, baseline, peak_rss_mb()
+
+
+def folder_respondents(folder):
+    """Names, sync position arrays, EDA arrays (NaN outside the events) and EventIndex per respondent of the
+    datafiles in `folder`, read with the settings of Fysiologisk.py the way its main script reads them."""
+    import Fysiologisk as settings
+    from datareader import read_respondent
+    from events import EventIndex, event_mask
+    names, syncpos, values, event_indices = list(), list(), list(), dict()
+    for datafile in sorted(os.listdir(folder)):
+        if not datafile.endswith(settings.filename_ext):
+            continue
+        parsed = read_respondent(os.path.join(folder, datafile), settings.sync_pos, settings.eda_data,
+                                 settings.pupil_data, settings.event_data, settings.Events_list, settings.delimiter,
+                                 settings.endbuffer, open(os.devnull, 'w'))
+        markers = sorted(parsed['event_positions'])
+        names.append(datafile.split('.')[0])
+        syncpos.append(parsed['position'])
+        values.append(np.where(event_mask(parsed['position'], markers), parsed['eda'], np.nan))
+        event_indices[names[-1]] = EventIndex(parsed['event_names'], markers, parsed['position'])
+    return names, syncpos, values, event_indices
+
+
+def has_root():
+    import imp
+    try:
+        imp.find_module('ROOT')
+    except ImportError:
+        return False
+    return True
+
+
+def meaninterval_variant(variant, respondents, nsamples, timewindow=30, scale=1. / 1000.):
+    from means import interval_means
+    from signalstore import SignalStore
+    if os.path.isdir(respondents):
+        import Fysiologisk as settings
+        names, syncpos, values, event_indices = folder_respondents(respondents)
+        eventnames = sorted(set(event for events in settings.Comparison_list.values() for event in events))
+    else:
+        names, syncpos, values = synthetic_respondents(int(respondents), nsamples)
+        event_indices = dict((name, synthetic_events(positions)) for name, positions in zip(names, syncpos))
+        eventnames = sorted(set(event_indices[names[0]].names))
+    store = SignalStore(names, syncpos, values)
+    baseline = peak_rss_mb()
+    start = time.time()
+    if variant == 'loop':
+        # the former meaninterval loop: a TH1F per interval, filled with the samples of the respondent inside it
+        from ROOT import TH1F
+        from histograms import fill
+        for event in eventnames:
+            eventhist = TH1F("peakspermin" + event, event, (12000 + timewindow) / timewindow, 0, 12000)
+            for respondent in names:
+                respdataarray = store.series(respondent)
+                events = event_indices[respondent]
+                for clip in events.clips(event):
+                    a = events.starts[clip] * scale
+                    b = events.stops[clip] * scale
+                    for interval in range(0, int(round((b - a) / timewindow))):
+                        hist = TH1F(str(respondent) + str(2 * clip) + "hist", str(respondent) + "hist",
+                                    int(len(respdataarray.values)), respdataarray.values.min(),
+                                    respdataarray.values.max())
+                        times = respdataarray.index.values * scale
+                        ininterval = (times > a + interval * timewindow) & (times <= a + interval * timewindow + timewindow)
+                        fill(hist, respdataarray.values[ininterval])
+                        eventhist.Fill(interval * timewindow, hist.GetMean())
+    elif variant == 'scan':
+        # the former loop without ROOT: every interval masks all samples of the respondent (histogram GetMean done in
+        # numpy - the maximum lands in the overflow bin and is left out)
+        for event in eventnames:
+            for name in names:
+                positions, eda = store.valid(name)
+                events = event_indices[name]
+                for clip in events.clips(event):
+                    a, b = events.starts[clip] * scale, events.stops[clip] * scale
+                    for interval in range(0, int(round((b - a) / timewindow))):
+                        times = positions * scale
+                        ininterval = (times > a + interval * timewindow) & (times <= a + interval * timewindow + timewindow)
+                        inside = eda[ininterval]
+                        inside = inside[inside < eda.max()]
+                        inside.mean() if len(inside) else 0.
+    else:
+        intervalmeans = interval_means(store, event_indices, eventnames, timewindow, scale)
+        if has_root():
+            from ROOT import TH1F
+            from histograms import fill
+            for event in eventnames:
+                eventhist = TH1F("peakspermin" + event, event, (12000 + timewindow) / timewindow, 0, 12000)
+                fill(eventhist, *intervalmeans[event])
+    return time.time() - start, baseline, peak_rss_mb()
+
+
+heavy_modules = ('ROOT', 'pandas', 'matplotlib', 'scipy', 'pyvttbl')
+startup_modules = ('Fysiologisk', 'datareader', 'signalstore', 'peakextraction', 'rendering', 'pandas', 'ROOT')
+
+# prints the seconds the import took and the heavy modules it loaded; runs in the fresh interpreter
+_startup_probe = '''import sys, time
+t = time.time()
+import %s
+elapsed = time.time() - t
+sys.stdout.write('%%f %%s\\n' %% (elapsed, ','.join(m for m in %r if m in sys.modules) or '-'))
+'''
+
+
+def import_time(module):
+    """Seconds to import `module` in a fresh interpreter and the heavy modules it imports (None if it fails)."""
+    try:
+        output = subprocess.check_output([sys.executable, '-c', _startup_probe % (module, heavy_modules)],
+                                         stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except subprocess.CalledProcessError:
+        return None
+    elapsed, loaded = output.split()[-2:]
+    return float(elapsed), loaded
+
+
+def startup(repeats):
+    print "%-16s %10s  %s" % ('module', 'time [ms]', 'heavy modules imported')
+    for module in startup_modules:
+        results = [import_time(module) for repeat in range(0, repeats)]
+        if None in results:
+            print "%-16s %10s  %s" % (module, '-', 'import fails')
+            continue
+        print "%-16s %10.1f  %s" % (module, 1000. * min(elapsed for elapsed, loaded in results), results[0][1])
+
+
+def run_variants(benchmark, variants, args):
+    print "%-12s %10s %14s %14s" % ('variant', 'time [s]', 'start RSS [MB]', 'peak RSS [MB]')
+    for variant in variants:
+        output = subprocess.check_output([sys.executable, __file__, '_' + benchmark, variant] + args)
+        print "%-12s %10s %14s %14s" % tuple([variant] + output.split())
+
+
+def main(argv):
+    if not argv:
+        print "usage: python benchmark.py multiindex [respondents] [samples]"
+        print "       python benchmark.py meaninterval [respondents|folder] [samples]"
+        print "       python benchmark.py startup [repeats]"
+        return
+    if argv[0] == 'multiindex':
+        defaults = ['10', '1000000']
+        run_variants('multiindex', ['tuples', 'arrays'], argv[1:] + defaults[len(argv) - 1:])
+    elif argv[0] == '_multiindex':
+        elapsed, baseline, peak = multiindex_variant(argv[1], int(argv[2]), int(argv[3]))
+        print "%.2f %s %s" % (elapsed, baseline and '%.0f' % baseline, peak and '%.0f' % peak)
+    elif argv[0] == 'meaninterval':
+        defaults = ['40', '200000']
+        variants = ['loop' if has_root() else 'scan', 'prefixsum']
+        run_variants('meaninterval', variants, argv[1:] + defaults[len(argv) - 1:])
+    elif argv[0] == '_meaninterval':
+        elapsed, baseline, peak = meaninterval_variant(argv[1], argv[2], int(argv[3]))
+        print "%.2f %s %s" % (elapsed, baseline and '%.0f' % baseline, peak and '%.0f' % peak)
+    elif argv[0] == 'startup':
+        startup(int(argv[1]) if len(argv) > 1 else 5)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
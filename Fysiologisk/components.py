@@ -0,0 +1,47 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Tonic/phasic decomposition of the EDA signal. The tonic component is the running mean over a window of samples
+# (what pd.rolling_mean(series, window) gave per respondent), the phasic component the absolute difference between
+# the signal and its tonic component. Both are computed together in one O(n) pass per respondent segment, written
+# into arrays aligned with the signal store.
+
+import numpy as np
+
+
+def running_mean(values, window, out=None):
+    """Mean of values[i - window + 1:i + 1] for every i, written into `out` (allocated if not given).
+
+    Like pd.rolling_mean(values, window): NaN for the first window - 1 samples and for every window that contains
+    a NaN. Computed from a running sum, so the cost does not depend on `window`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if out is None:
+        out = np.empty(len(values))
+    out[:] = np.nan
+    if len(values) < window:
+        return out
+    missing = np.isnan(values)
+    # sums relative to the first sample keep the running sum small, so long segments do not lose precision
+    reference = values[~missing][0] if not missing.all() else 0.
+    sums = np.concatenate(([0.], np.cumsum(np.where(missing, 0., values - reference))))
+    nmissing = np.concatenate(([0], np.cumsum(missing)))
+    complete = nmissing[window:] == nmissing[:-window]
+    means = (sums[window:] - sums[:-window]) / window + reference
+    out[window - 1:][complete] = means[complete]
+    return out
+
+
+def tonic_phasic(store, window):
+    """Tonic and phasic component of the signal in `store`, as two stores with the same layout.
+
+    The running mean is taken per respondent segment over all its samples (NaN outside events included, so windows
+    reaching outside an event are NaN), never across two respondents.
+    """
+    tonic = store.allocate()
+    phasic = store.allocate()
+    for i in range(0, len(store.names)):
+        lo, hi = store.offsets[i], store.offsets[i + 1]
+        running_mean(store.values[lo:hi], window, tonic[lo:hi])
+        np.subtract(store.values[lo:hi], tonic[lo:hi], phasic[lo:hi])
+    np.abs(phasic, phasic)  # negative peaks transformed into positive peaks
+    return store.like(tonic), store.like(phasic)
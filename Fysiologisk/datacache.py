@@ -0,0 +1,84 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Binary cache of parsed respondent files. Each source file gets one .npz entry in the cache directory holding the
+# parsed arrays together with the path, size, mtime and SHA-1 of the file it was made from. An entry is used only
+# while the file still has the same size and either the same mtime or the same content; otherwise it is rebuilt.
+
+import hashlib
+import os
+
+import numpy as np
+
+cache_version = 1  # bump when the layout of the cached arrays changes
+meta_keys = ('cache_version', 'path', 'size', 'mtime', 'digest', 'tag')
+
+
+def file_digest(path, blocksize=1 << 20):
+    """SHA-1 of the content of `path`."""
+    sha = hashlib.sha1()
+    fhandle = open(path, 'rb')
+    block = fhandle.read(blocksize)
+    while block:
+        sha.update(block)
+        block = fhandle.read(blocksize)
+    fhandle.close()
+    return sha.hexdigest()
+
+
+def entry_path(cache_dir, path):
+    """Location of the cache entry belonging to source file `path`."""
+    name = hashlib.sha1(os.path.abspath(path)).hexdigest()
+    return os.path.join(cache_dir, os.path.basename(path) + '.' + name[:12] + '.npz')
+
+
+def load(cache_dir, path, tag, digest=None, with_digest=False):
+    """Return the cached arrays of `path` as a dict, or None if there is no valid entry.
+
+    `tag` describes how the arrays were produced (columns, events, ...); an entry made with another tag is stale.
+    `digest` is the SHA-1 of `path` if the caller already has it, so a touched file is not hashed again. With
+    `with_digest` the pair (arrays, SHA-1 of the file stored in the entry) is returned, (None, None) without entry.
+    """
+    arrays, stored_digest = _load(cache_dir, path, tag, digest)
+    if with_digest:
+        return arrays, stored_digest
+    return arrays
+
+
+def _load(cache_dir, path, tag, digest):
+    entry = entry_path(cache_dir, path)
+    if not os.path.exists(entry):
+        return None, None
+    data = np.load(entry)
+    try:
+        if int(data['cache_version']) != cache_version or str(data['tag']) != tag:
+            return None, None
+        st = os.stat(path)
+        if int(data['size']) != st.st_size:
+            return None, None
+        arrays = dict((key, data[key]) for key in data.files if key not in meta_keys)
+        stored_mtime, stored_digest = float(data['mtime']), str(data['digest'])
+    finally:
+        data.close()
+    if stored_mtime != st.st_mtime:
+        # touched but maybe not changed - compare content before throwing the entry away
+        if (digest if digest is not None else file_digest(path)) != stored_digest:
+            return None, None
+        save(cache_dir, path, tag, arrays, stored_digest)
+    return arrays, stored_digest
+
+
+def save(cache_dir, path, tag, arrays, digest=None):
+    """Store the dict of numpy arrays `arrays` as the cache entry of `path`."""
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    st = os.stat(path)
+    if digest is None:
+        digest = file_digest(path)
+    entry = entry_path(cache_dir, path)
+    # write next to the entry and rename, so an interrupted run never leaves a half written entry behind
+    tmp = entry + '.tmp.npz'
+    np.savez(tmp, cache_version=cache_version, path=os.path.abspath(path), size=st.st_size, mtime=st.st_mtime,
+             digest=digest, tag=tag, **arrays)
+    if os.path.exists(entry):
+        os.remove(entry)
+    os.rename(tmp, entry)
@@ -0,0 +1,227 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Reader for the ';'-separated ASCII exports of Biometric Software Suite.
+# The header is parsed once and every requested column (numeric signals and the event tag column) is pulled
+# out of the same pass over the file, so a respondent file is only read one time.
+# Two engines are available: 'pandas' parses blocks of rows with the C reader (decimal commas are handled by the
+# parser itself), 'python' is the plain line-by-line reader kept as a fallback.
+
+import multiprocessing
+import os
+import sys
+from StringIO import StringIO
+from array import array
+from itertools import izip
+
+import numpy as np
+
+import datacache
+
+chunksize = 200000  # rows per block in the pandas engine
+
+
+def forward_fill(values, start=0.0):
+    """Replace NaN entries by the last non-NaN value before them (`start` before the first one)."""
+    valid = ~np.isnan(values)
+    last_valid = np.where(valid, np.arange(len(values)), -1)
+    np.maximum.accumulate(last_valid, out=last_valid)
+    return np.where(last_valid >= 0, values[last_valid], start)
+
+
+def read_columns(path, labels, event_label=None, position_label=None, events=(), delimiter=';', endbuffer=0,
+                 log=None, engine='pandas'):
+    """Read the numeric columns named in `labels` and the event markers of a respondent file in one pass.
+
+    Blank numeric cells repeat the last value read in that column (0 at the start of the file).
+    If `event_label` is given, every row whose tag is in `events` is recorded together with the integer
+    value of its `position_label` column (`endbuffer` is added when a tag repeats the previous one).
+    Returns (dict of label -> float64 array, list of event names, list of event positions).
+    """
+    if engine == 'pandas':
+        return _read_columns_pandas(path, labels, event_label, position_label, events, delimiter, endbuffer, log)
+    return _read_columns_python(path, labels, event_label, position_label, events, delimiter, endbuffer, log)
+
+
+def read_respondent(path, sync_pos, eda_data, pupil_data, event_data, events, delimiter=';', endbuffer=0, log=None,
+                    cache_dir=None, digest=False):
+    """Parse one respondent file into its position, EDA and mean pupil arrays and its event markers.
+
+    Returns a dict with keys 'position', 'eda', 'pupil' (float64 arrays), 'event_names' and 'event_positions'
+    (lists in file order). With a `cache_dir` the parsed arrays are taken from, or stored in, the binary cache.
+    With `digest` the SHA-1 of the file is added as 'digest' (from the cache entry if there is one), so later steps
+    keyed on the file content need not read it again.
+    """
+    tag = repr((sync_pos, eda_data, list(pupil_data), event_data, list(events), delimiter, endbuffer))
+    respondent, sha = None, None
+    if cache_dir is not None:
+        respondent, sha = datacache.load(cache_dir, path, tag, with_digest=True)
+    if respondent is None:
+        sha = datacache.file_digest(path) if cache_dir is not None or digest else None
+        columns, event_names, event_positions = read_columns(path, [sync_pos, eda_data] + list(pupil_data),
+                                                             event_data, sync_pos, events, delimiter, endbuffer,
+                                                             log)
+        respondent = dict(position=columns[sync_pos], eda=columns[eda_data],
+                          pupil=sum([columns[label] for label in pupil_data]) / float(len(pupil_data)),
+                          event_names=np.array(event_names, dtype=str),
+                          event_positions=np.array(event_positions, dtype=np.int64))
+        if cache_dir is not None:
+            datacache.save(cache_dir, path, tag, respondent, sha)
+    respondent['event_names'] = respondent['event_names'].tolist()
+    respondent['event_positions'] = respondent['event_positions'].tolist()
+    if digest:
+        respondent['digest'] = sha
+    return respondent
+
+
+def read_respondents(paths, workers, sync_pos, eda_data, pupil_data, event_data, events, delimiter=';', endbuffer=0,
+                     log=None, cache_dir=None, digest=False):
+    """read_respondent() for every file in `paths` on a pool of `workers` processes, yielding the respondents.
+
+    The files are independent, so they are parsed in parallel; the results are yielded in the order of `paths` as
+    soon as they are parsed, so the caller can store each one and drop it before the next arrives.
+    Messages of each file are written to `log` in that same order.
+    """
+    jobs = [(path, sync_pos, eda_data, list(pupil_data), event_data, list(events), delimiter, endbuffer, cache_dir,
+             digest) for path in paths]
+    pool = None
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        results = pool.imap(_read_respondent_job, jobs, chunksize=1)
+    else:
+        results = (_read_respondent_job(job) for job in jobs)
+    try:
+        for path, (respondent, messages) in izip(paths, results):
+            print >> log, "Processing dataset: ", os.path.basename(path)
+            if messages:
+                (log if log is not None else sys.stdout).write(messages)
+            yield respondent
+    finally:
+        # also when the caller stops early: the queued files are parsed to the end and dropped (terminate() can
+        # hang in python 2 while large results are still in the pipe)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _read_respondent_job(job):
+    # runs in the worker processes: messages are collected and handed back with the arrays
+    path, sync_pos, eda_data, pupil_data, event_data, events, delimiter, endbuffer, cache_dir, digest = job
+    messages = StringIO()
+    respondent = read_respondent(path, sync_pos, eda_data, pupil_data, event_data, events, delimiter, endbuffer,
+                                 messages, cache_dir, digest)
+    return respondent, messages.getvalue()
+
+
+def _read_columns_python(path, labels, event_label, position_label, events, delimiter, endbuffer, log):
+    fhandle = open(path, 'r')
+
+    header = fhandle.readline().split(delimiter)
+    label_lookup = [header.index(label) for label in labels]
+    if event_label is not None:
+        label_lookup_event = header.index(event_label)
+        label_lookup_position = header.index(position_label)
+
+    columns = [array('d') for label in labels]
+    last = [0.0] * len(labels)
+    event_names = list()
+    event_positions = list()
+    previous = ""
+
+    for p in fhandle:
+        p1 = p.split(delimiter)
+
+        for icol in range(0, len(label_lookup)):
+            cell = p1[label_lookup[icol]]
+            if cell != '':
+                last[icol] = float(cell.replace(',', '.'))
+            columns[icol].append(last[icol])
+
+        if event_label is None:
+            continue
+        if len(p1) < label_lookup_event:
+            print >> log, "Error. Unknown error occured when slicing events from dataset"
+            print >> log, "A discrepancy between lenght of dataset and event position. Event position exceeded the lenght of dataset."
+            print >> log, "Lenght of dataset: ", len(p1)
+            print >> log, "Event label position: ", label_lookup_event
+            print >> log, "track back error halts script from continuing."
+        if p1[label_lookup_event] in events:
+            event_names.append(p1[label_lookup_event])
+            value_to_add = 0
+            try:
+                value_to_add = int((p1[label_lookup_position]))
+            except ValueError:
+                print >> log, "Error. Blank cell or string data detected where integer data was expected."
+                print >> log, "This will result in failure to slice events. Dataset should be corrected before continuing"
+                print >> log, "Stop script execution and remove or correct dataset."
+            # Add a buffer to the end of the sequence to catch EDA reactions with delay.
+            if p1[label_lookup_event] == previous:
+                event_positions.append(value_to_add + endbuffer)
+            else:
+                event_positions.append(value_to_add)
+            previous = p1[label_lookup_event]
+
+    fhandle.close()
+
+    data = dict()
+    for icol in range(0, len(labels)):
+        data[labels[icol]] = np.frombuffer(columns[icol], dtype=np.float64)
+    return data, event_names, event_positions
+
+
+def _read_columns_pandas(path, labels, event_label, position_label, events, delimiter, endbuffer, log):
+    import pandas as pd
+    usecols = list(labels)
+    dtypes = dict((label, np.float64) for label in labels)
+    if event_label is not None:
+        usecols.append(event_label)
+        dtypes[event_label] = str
+        if position_label not in usecols:
+            usecols.append(position_label)
+            dtypes[position_label] = np.float64
+    # only blank cells count as missing, so they can be forward filled like in the python engine.
+    # float_precision='high' is the precise xstrtod parser, but unlike float() it is not guaranteed to round
+    # correctly and can be off by one ulp ('round_trip' would be exact, but ignores decimal=',' in pandas 0.24).
+    # Use engine='python' where bit-identical values are required.
+    reader = pd.read_csv(path, sep=delimiter, decimal=',', usecols=usecols, dtype=dtypes, engine='c',
+                         na_values=[''], keep_default_na=False, float_precision='high', chunksize=chunksize)
+
+    columns = dict((label, list()) for label in labels)
+    last = dict((label, 0.0) for label in labels)
+    event_names = list()
+    event_positions = list()
+    previous = ""
+
+    for chunk in reader:
+        for label in labels:
+            filled = forward_fill(chunk[label].values, last[label])
+            if len(filled) > 0:
+                last[label] = filled[-1]
+            columns[label].append(filled)
+
+        if event_label is None:
+            continue
+        tags = chunk[event_label]
+        is_event = tags.isin(events).values
+        for tag, position in zip(tags.values[is_event], chunk[position_label].values[is_event]):
+            event_names.append(tag)
+            value_to_add = 0
+            if np.isnan(position) or position != int(position):
+                print >> log, "Error. Blank cell or string data detected where integer data was expected."
+                print >> log, "This will result in failure to slice events. Dataset should be corrected before continuing"
+                print >> log, "Stop script execution and remove or correct dataset."
+            else:
+                value_to_add = int(position)
+            # Add a buffer to the end of the sequence to catch EDA reactions with delay.
+            if tag == previous:
+                event_positions.append(value_to_add + endbuffer)
+            else:
+                event_positions.append(value_to_add)
+            previous = tag
+
+    data = dict()
+    for label in labels:
+        if columns[label]:
+            data[label] = np.concatenate(columns[label])
+        else:
+            data[label] = np.zeros(0)
+    return data, event_names, event_positions
@@ -0,0 +1,88 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Event handling: which samples of a respondent lie inside the events (clips) marked in the datafile.
+
+import numpy as np
+
+
+def event_mask(positions, markers):
+    """Boolean mask of the samples in `positions` that lie inside an event.
+
+    `markers` are the sorted event start/stop positions. Walking through the samples, a marker switches between
+    outside and inside when a sample position equals it exactly; one marker is used per sample, and a marker that
+    matches no later sample stops all further switching. Only the matching is done per marker, the mask itself is
+    built in one go.
+    """
+    positions = np.asarray(positions)
+    nsamples = len(positions)
+    with np.errstate(invalid='ignore'):
+        ordered = bool(np.all(positions[1:] >= positions[:-1]))
+
+    switches = np.zeros(nsamples, dtype=bool)
+    start = 0
+    for marker in markers:
+        if start >= nsamples:
+            break
+        if ordered:
+            i = max(np.searchsorted(positions, marker, 'left'), start)
+            if i >= nsamples or positions[i] != marker:
+                break
+        else:
+            hits = np.flatnonzero(positions[start:] == marker)
+            if len(hits) == 0:
+                break
+            i = start + hits[0]
+        switches[i] = True
+        start = i + 1
+
+    return np.logical_xor.accumulate(switches)
+
+
+class EventIndex(object):
+    """The events (clips) of one respondent: name and start/stop sync position of every clip.
+
+    Built from the event names in file order and the sorted marker positions: clip k is named names[2k] and runs
+    from marker 2k to marker 2k+1. Clips of an event are looked up by name through a dict, the clip around a sync
+    position by bisection of the start positions. If the respondent's sync positions are given, the sample offsets
+    of every clip in that array are precomputed as `start_offsets`/`stop_offsets` (samples with start < x <= stop).
+    """
+
+    def __init__(self, names, positions, syncpos=None):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        nclips = min(len(names), len(self.positions)) // 2
+        self.names = [names[2 * clip] for clip in range(0, nclips)]
+        self.starts = self.positions[0:2 * nclips:2]
+        self.stops = self.positions[1:2 * nclips:2]
+        self._clips = dict()
+        for clip in range(0, nclips):
+            self._clips.setdefault(self.names[clip], list()).append(clip)
+        if syncpos is not None:
+            self.start_offsets, self.stop_offsets = self.sample_ranges(syncpos)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def first(self):
+        """Position of the first marker (start of the first clip)."""
+        return self.positions[0]
+
+    @property
+    def last(self):
+        """Position of the last marker."""
+        return self.positions[-1]
+
+    def clips(self, name):
+        """Clip numbers of the event `name`, in order (empty if the respondent has no such event)."""
+        return self._clips.get(name, [])
+
+    def clip_at(self, position):
+        """Number of the clip with start < `position` <= stop, or -1 if the position is outside all clips."""
+        clip = np.searchsorted(self.starts, position, 'left') - 1
+        if clip < 0 or position > self.stops[clip]:
+            return -1
+        return clip
+
+    def sample_ranges(self, syncpos):
+        """Offsets [lo, hi) of the samples of each clip (start < x <= stop) in the sorted sync positions `syncpos`."""
+        return np.searchsorted(syncpos, self.starts, 'right'), np.searchsorted(syncpos, self.stops, 'right')
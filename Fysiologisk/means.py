@@ -0,0 +1,109 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Mean values of the signals per clip, computed for all respondents at once from cumulative sums
+# over the compacted signal store instead of filling a throwaway histogram per respondent and clip
+# (or per clip and time interval).
+# The means are the ones TH1F(name, title, n, min, max).GetMean() gave when filled with the
+# respondent's samples: samples equal to the respondent's maximum fall in the overflow bin and do
+# not count, and an empty clip has mean 0.
+
+import numpy as np
+
+
+def _counted_sums(store):
+    """Cumulative count and sum of the samples that enter the mean, the compacted sync positions and
+    offsets, and where each respondent's sums start.
+
+    The running sums restart at every respondent: segment i is preceded by its own 0 at position
+    offsets[i] + i, so sample j of the compacted signal (in segment i) has its running sum at
+    j + i + 1, and a window mean never subtracts sums taken over earlier respondents.
+    """
+    syncpos, values, offsets = store.compacted()
+    nsegments = len(offsets) - 1
+    starts = offsets[:-1] + np.arange(0, nsegments)
+    counts = store.allocate(length=len(values) + nsegments)
+    sums = store.allocate(length=len(values) + nsegments)
+    # one respondent segment at a time (without temporaries the size of the cohort)
+    for i in range(0, nsegments):
+        lo, hi = offsets[i], offsets[i + 1]
+        counts[starts[i]] = sums[starts[i]] = 0.
+        if hi == lo:
+            continue
+        segment = values[lo:hi]
+        vmin, vmax = segment.min(), segment.max()
+        # (a respondent with a constant signal has no overflow - the histogram range is then set from
+        # the data)
+        weights = ~((segment >= vmax) & (vmax > vmin))
+        counts[starts[i] + 1:starts[i] + 1 + hi - lo] = np.cumsum(weights)
+        sums[starts[i] + 1:starts[i] + 1 + hi - lo] = np.cumsum(np.where(weights, segment, 0.))
+    return [counts, sums], syncpos, offsets, starts
+
+
+def _window_means(cumulative, lo, hi):
+    """Means of the samples between the running sum positions lo and hi (of one respondent), 0 for
+    windows without samples."""
+    count = cumulative[0][hi] - cumulative[0][lo]
+    sums = cumulative[1][hi] - cumulative[1][lo]
+    filled = count > 0
+    means = np.zeros(len(count))
+    means[filled] = sums[filled] / count[filled]
+    return means
+
+
+def clip_means(store, event_indices, names=None):
+    """Mean of the non-NaN samples with start < syncpos <= stop in every clip.
+
+    `event_indices` maps respondent -> EventIndex. Returns a dict respondent -> array with one entry
+    per clip of the respondent's EventIndex, for the respondents `names` (default: all in the store).
+    """
+    cumulative, syncpos, offsets, segment_starts = _counted_sums(store)
+    names = store.names if names is None else names
+    number = dict((name, i) for i, name in enumerate(store.names))
+    lo, hi, nclips = list(), list(), list()
+    for name in names:
+        i = number[name]
+        first, last = offsets[i], offsets[i + 1]
+        start_offsets, stop_offsets = event_indices[name].sample_ranges(syncpos[first:last])
+        lo.append(segment_starts[i] + start_offsets)
+        hi.append(segment_starts[i] + stop_offsets)
+        nclips.append(len(start_offsets))
+    if not names:
+        return dict()
+    means = _window_means(cumulative, np.concatenate(lo), np.concatenate(hi))
+    bounds = np.cumsum([0] + nclips)
+    return dict((name, means[bounds[i]:bounds[i + 1]]) for i, name in enumerate(names))
+
+
+def interval_means(store, event_indices, events, timewindow, scale=1., names=None):
+    """Mean of the non-NaN samples in consecutive `timewindow` wide time intervals of every clip of
+    each event.
+
+    Times are syncpos * `scale`. A clip from a = start * scale to b = stop * scale is split into
+    int(round((b - a) / timewindow)) intervals, interval k holding the samples with
+    a + k * timewindow < time <= a + k * timewindow + timewindow. Returns a dict
+    event -> (x, means) with the interval offsets x = k * timewindow and the interval means, in
+    respondent, clip, interval order, for the respondents `names` (default: all in the store).
+    """
+    cumulative, syncpos, offsets, segment_starts = _counted_sums(store)
+    times = syncpos * scale
+    names = store.names if names is None else names
+    number = dict((name, i) for i, name in enumerate(store.names))
+    result = dict()
+    for event in set(events):
+        lo, hi, x = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for name in names:
+            clips = event_indices[name].clips(event)
+            if not clips:
+                continue
+            first, last = offsets[number[name]], offsets[number[name] + 1]
+            starts = event_indices[name].starts[clips] * scale
+            stops = event_indices[name].stops[clips] * scale
+            nintervals = [int(round((b - a) / timewindow)) for a, b in zip(starts, stops)]
+            k = np.concatenate([np.arange(0, n) for n in nintervals])
+            edges = np.repeat(starts, nintervals) + k * timewindow
+            start = segment_starts[number[name]]
+            lo.append(start + np.searchsorted(times[first:last], edges, 'right'))
+            hi.append(start + np.searchsorted(times[first:last], edges + timewindow, 'right'))
+            x.append(k * float(timewindow))
+        result[event] = (np.concatenate(x), _window_means(cumulative, np.concatenate(lo), np.concatenate(hi)))
+    return result
@@ -0,0 +1,49 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Per-respondent partial results for incremental re-analysis. The expensive per-respondent steps (the peak search
+# and background extraction) store what they found for every respondent in an entry of the binary cache format of
+# datacache.py: one .npz per respondent file and step, tagged with the settings of the step. An entry is used while
+# the respondent file and the tag are unchanged, so after adding a respondent only that one is searched again; the
+# summary histograms are filled from the partials of all respondents like in a full run.
+
+import os
+
+import numpy as np
+
+import datacache
+
+
+def load(partials_dir, step, path, tag, digest=None):
+    """The arrays stored for `step` of the respondent file `path`, or None if the file or the tag changed.
+    `digest` is the SHA-1 of the file when known (see read_respondent), so the file is not read again."""
+    return datacache.load(os.path.join(partials_dir, step), path, tag, digest)
+
+
+def save(partials_dir, step, path, tag, arrays, digest=None):
+    """Store the dict of numpy arrays `arrays` as the partial of `step` for the respondent file `path` (whose SHA-1
+    is `digest`; it is computed from the file when not given)."""
+    datacache.save(os.path.join(partials_dir, step), path, tag, arrays, digest)
+
+
+def pack_windows(windows):
+    """The window results of extract_respondents() for one respondent (a list of tuples of arrays) as flat arrays."""
+    arrays = dict(nwindows=np.array(len(windows)))
+    nfields = len(windows[0]) if windows else 0
+    for field in range(0, nfields):
+        values = [np.asarray(window[field]) for window in windows]
+        arrays['lengths%d' % field] = np.array([len(value) for value in values], dtype=np.int64)
+        arrays['values%d' % field] = np.concatenate(values)
+    return arrays
+
+
+def unpack_windows(arrays):
+    """Inverse of pack_windows()."""
+    nwindows = int(arrays['nwindows'])
+    fields = list()
+    field = 0
+    while 'values%d' % field in arrays:
+        bounds = np.concatenate(([0], np.cumsum(arrays['lengths%d' % field])))
+        values = arrays['values%d' % field]
+        fields.append([values[bounds[i]:bounds[i + 1]] for i in range(0, nwindows)])
+        field += 1
+    return [tuple(field[i] for field in fields) for i in range(0, nwindows)]
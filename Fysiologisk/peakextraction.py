@@ -0,0 +1,121 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Peak and background extraction per respondent. The respondent histogram (TH1F of len/20 bins filled with the
+# signal) is binned with numpy, the peaks and the SNIP background of each requested range are found by a peak finder
+# backend, and what the summary histograms need comes back as arrays: peak positions and the binned tonic
+# (background) and phasic (signal - background) contents. Respondents are independent, so they run on a pool of
+# worker processes, each with its own peak finder (and its own ROOT when the backend is TSpectrum); the results come
+# back in job order so the caller fills its histograms in the same order as a serial run.
+
+import multiprocessing
+import sys
+from StringIO import StringIO
+
+import numpy as np
+
+from histograms import axis_range, bin_centers, bin_contents, find_bin, integral
+from peakfinder import peak_bins, peakfinder
+
+background_iterations = 20  # Background(hist, 20, "Compton")
+
+_worker = dict()  # peak finders and settings of this process, set by _start_worker
+
+
+def range_peaks(finder, binned, first, last, centers, sigma, threshold, withbackground=True, checkfinder=None):
+    """Peaks in bins first..last of the histogram contents `binned` (bins 0..nbins+1, centres `centers`).
+
+    Returns the peak positions (bin centres), the Background(hist, 20, "Compton") contents of all bins (0 outside
+    the range, float32 like the TH1F TSpectrum returns) and a message if `checkfinder` finds other peak bins.
+    """
+    source = np.asarray(binned[first:last + 1], dtype=np.float64)
+    positions = finder.search(source, sigma, threshold)
+    peaksx = centers[peak_bins(positions, first)]
+    bg = np.zeros(len(binned))
+    if withbackground:
+        bg[first:last + 1] = np.float32(finder.background(source, background_iterations, compton=True))
+    message = None
+    if checkfinder is not None:
+        check = checkfinder.search(source, sigma, threshold)
+        if not np.array_equal(np.sort(peak_bins(check, first)), np.sort(peak_bins(positions, first))):
+            message = "bins %d-%d: %d vs. %d peaks" % (first, last, len(positions), len(check))
+    return peaksx, bg, message
+
+
+def respondent_histogram(syncpos, values):
+    """Contents (bins 0..nbins+1) and axis (nbins, xlow, xup) of TH1F(.., int(len/20), syncpos[0], syncpos[-1])
+    filled with all samples but the last."""
+    nbins = max(int(len(syncpos) / 20), 1)
+    axis = (nbins, float(syncpos[0]), float(syncpos[-1]))
+    return bin_contents(syncpos[:-1], values[:-1], *axis), axis
+
+
+def window_extract(binned, axis, a, b, scaling):
+    """Peaks, tonic and phasic component of the range a..b of a respondent histogram, as the peak plots did it with
+    SetRangeUser(a, b), Scale, TSpectrum Search/Background and hist.Add(bg, -1).
+
+    `scaling` is 'range' for Scale(1/Integral()) or 'clip' for the per-clip normalisation of npeaksspecificminutes,
+    whose check Integral(FindBin(a), FindBin(b) != 0) integrates from FindBin(a) up to the overflow bin. Returns the
+    peak positions and the bin centres of bins FindBin(a)..FindBin(b)-1, both relative to a, and the tonic and
+    phasic contents of those bins.
+    """
+    nbins, xlow, xup = axis
+    first, last = axis_range(nbins, xlow, xup, a, b)
+    bina, binb = int(find_bin(a, *axis)), int(find_bin(b, *axis))
+    if scaling == 'range':
+        binned = np.float32(binned * (1. / integral(binned, first, last)))
+    elif scaling == 'clip' and integral(binned, bina, int(binb != 0)):
+        binned = np.float32(binned * (1. / integral(binned, bina, binb)))
+    centers = bin_centers(nbins, xlow, xup)
+    peaksx, bg, message = range_peaks(_worker['finder'], binned, first, last, centers, _worker['sigma'],
+                                      _worker['threshold'], checkfinder=_worker['checkfinder'])
+    phasic = np.float32(binned - bg)
+    bins = np.arange(bina, binb)
+    return (peaksx - a, centers[bins] - a, bg[bins], phasic[bins].astype(np.float64)), message
+
+
+def extract_respondents(jobs, workers, backend, sigma, threshold, checkbackend=None, log=None):
+    """window_extract() for every (syncpos, values, windows) job on a pool of `workers` processes.
+
+    `windows` is a list of (a, b, scaling). Returns, in the order of `jobs`, the list of results of the windows of
+    each job. Disagreements with `checkbackend` are written to `log` in that same order.
+    """
+    settings = (backend, checkbackend, sigma, threshold)
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)), _start_worker, settings)
+        try:
+            results = pool.map(_extract_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _start_worker(*settings)
+        results = [_extract_job(job) for job in jobs]
+
+    extracted = list()
+    for windows, messages in results:
+        if messages:
+            (log if log is not None else sys.stdout).write(messages)
+        extracted.append(windows)
+    return extracted
+
+
+def _start_worker(backend, checkbackend, sigma, threshold):
+    _worker['finder'] = peakfinder(backend)
+    _worker['checkfinder'] = peakfinder(checkbackend) if checkbackend else None
+    _worker['sigma'], _worker['threshold'] = sigma, threshold
+
+
+def _extract_job(job):
+    # runs in the worker processes: the respondent is binned once for all its windows
+    syncpos, values, windows = job
+    if not windows:
+        return [], ''
+    binned, axis = respondent_histogram(syncpos, values)
+    messages = StringIO()
+    results = list()
+    for a, b, scaling in windows:
+        result, message = window_extract(binned, axis, a, b, scaling)
+        if message:
+            print >> messages, "Peak finders disagree in range %s-%s, %s" % (a, b, message)
+        results.append(result)
+    return results, messages.getvalue()
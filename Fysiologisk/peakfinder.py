@@ -0,0 +1,270 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Peak finding on plain arrays of bin contents. Two backends with the same interface:
+#  - 'tspectrum': ROOT's TSpectrum, called on the arrays (SearchHighRes/Background) instead of on a drawn histogram
+#  - 'numpy':     a port of the same algorithms to numpy, so peaks can be found without ROOT (and in worker processes).
+#                 Experimental: until tests/peakfinder_tests.py passes against TSpectrum results recorded with ROOT
+#                 (tests/data/tspectrum_reference.json), 'tspectrum' is the backend to use for results
+# Both implement TSpectrum.Search(hist, sigma, "noMarkov", threshold) - background removal, Gold deconvolution with
+# a gaussian response of width sigma and the relative amplitude threshold - and TSpectrum.Background(hist, n,
+# "Compton") - SNIP clipping with a decreasing window, 2nd order filter and 3 point smoothing. The numpy port keeps
+# intermediate results in float32 like TSpectrum of ROOT 5.34 does.
+# Positions are returned in channels of the searched array; peak_bins turns them into histogram bin numbers the same
+# way TSpectrum.Search does.
+
+import numpy as np
+
+max_peaks = 100  # TSpectrum default fMaxPeaks
+deconvolution_iterations = 3  # TSpectrum fgIterations
+peak_window = 1024  # TSpectrum PEAK_WINDOW, limits sigma
+
+
+def peak_bins(positions, first):
+    """Histogram bin of each peak position found in the contents of bins first..last (as TSpectrum::Search)."""
+    return first + (np.asarray(positions, dtype=np.float64) + 0.5).astype(np.int64)
+
+
+def _search_sigma(sigma, size):
+    if sigma < 1:
+        # TSpectrum::Search picks a sigma from the number of bins when none is given
+        sigma = min(max(size // max_peaks, 1), 8)
+    return sigma
+
+
+def _extend(source, shift, l1low):
+    """Values of the source extended by `shift` channels on both sides (left: linear, right: constant), unclipped,
+    in float64."""
+    left = source[0] + l1low * (np.arange(0, shift) - shift)
+    right = np.repeat(np.float64(source[-1]), shift)
+    return np.concatenate((np.maximum(left, 0.), source.astype(np.float64), np.maximum(right, 0.)))
+
+
+def search(source, sigma, threshold, background_remove=True, iterations=deconvolution_iterations, dtype=np.float32):
+    """Channel positions of the peaks in `source`, highest first - TSpectrum::Search with option "noMarkov".
+
+    Peaks must stand `sigma` wide above the background and be higher than `threshold` (0..1) times the highest peak.
+    An empty array is returned where TSpectrum refuses to search (e.g. fewer channels than the clipping window).
+    """
+    source = np.asarray(source, dtype=dtype)
+    ssize = len(source)
+    sigma = np.float32(_search_sigma(sigma, ssize))
+    threshold = 100. * threshold
+    none = np.zeros(0)
+    number_iterations = int(7 * sigma + 0.5)
+    if ssize == 0 or sigma < 1 or threshold <= 0 or threshold >= 100 or int(5. * sigma + 0.5) >= peak_window // 2:
+        return none
+    if background_remove and ssize < 2 * number_iterations + 1:
+        return none
+
+    # slope of the first channels, used to extend the spectrum to the left
+    k = int(2 * sigma + 0.5)
+    l1low = 0.
+    if k >= 2:
+        a = np.arange(0, k, dtype=np.float64)
+        b = source[:k].astype(np.float64)
+        m0low, m1low, m2low, l0low, l1low = float(k), a.sum(), (a * a).sum(), b.sum(), (a * b).sum()
+        detlow = m0low * m2low - m1low * m1low
+        l1low = (-l0low * m1low + l1low * m0low) / detlow if detlow != 0 else 0.
+        l1low = min(l1low, 0.)
+
+    shift = number_iterations
+    size_ext = ssize + 2 * shift
+    extended = _extend(source, shift, l1low)
+    spectrum = extended.astype(dtype)
+
+    if background_remove:
+        # SNIP clipping with an increasing window, then subtract the background from the extended source
+        clipped = spectrum.copy()
+        for i in range(1, number_iterations + 1):
+            clipped[i:size_ext - i] = np.minimum(clipped[i:size_ext - i],
+                                                 (clipped[:size_ext - 2 * i] + clipped[2 * i:]) / 2.0)
+        spectrum = np.maximum((extended - clipped).astype(dtype), 0)
+
+    # response: gaussian of width sigma centred at 3 sigma, integer valued as in TSpectrum
+    channels = np.arange(0, size_ext, dtype=np.float64)
+    lda = (channels - 3 * sigma) ** 2 / np.float32(2 * sigma * sigma)
+    response = (1000 * np.exp(-lda)).astype(np.int64).astype(np.float64)
+    nonzero = np.flatnonzero(response)
+    lh_gold = nonzero[-1] + 1 if len(nonzero) else 0
+    area = response.sum()
+    posit = int(np.argmax(response)) if area > 0 else 0
+    response = response[:lh_gold]
+
+    # Gold deconvolution: at*a (autocorrelation of the response) and p = at*y
+    autocorrelation = np.correlate(response, response, 'full').astype(dtype).astype(np.float64)
+    padded = np.concatenate((np.zeros(lh_gold - 1), np.abs(spectrum).astype(np.float64), np.zeros(2 * lh_gold - 2)))
+    p = np.correlate(padded, response, 'valid').astype(dtype)
+    numerator = p[:size_ext].astype(np.float64)
+    # TSpectrum keeps p in a buffer one channel block wide; what does not fit lands in the iteration buffer
+    result = np.zeros(size_ext, dtype=dtype)
+    spill = p[size_ext:size_ext + size_ext]
+    result[:len(spill)] = spill
+    x = np.ones(size_ext, dtype=dtype)
+    for lindex in range(0, iterations):
+        update = (np.abs(numerator) > 0.00001) & (np.abs(x) > 0.00001)
+        folded = np.convolve(x.astype(np.float64), autocorrelation)[lh_gold - 1:lh_gold - 1 + size_ext]
+        ratio = np.zeros(size_ext)
+        np.divide(numerator, folded, ratio, where=folded != 0)
+        result[update] = (ratio * x)[update]
+        x = result.copy()
+
+    # shift the deconvolved spectrum back by the position of the response maximum and scale it
+    rolled = np.roll(x, posit)
+    decon = x.copy()
+    j = lh_gold - 1
+    written = np.arange(0, size_ext - j)
+    inside = (written >= shift) & (written < ssize + shift)
+    decon[written] = 0
+    decon[written[inside]] = (area * rolled[written[inside] + j].astype(np.float64)).astype(dtype)
+    maximum_decon = max(0., decon[written[inside]].max()) if inside.any() else 0.
+    maximum = max(0., spectrum[written[inside]].max()) if inside.any() else 0.
+    lda = min(1., threshold) / 100
+
+    # local maxima of the deconvolved spectrum that pass both thresholds, ordered by height in the source
+    i = np.arange(1, size_ext - 1)
+    decon64 = decon.astype(np.float64)
+    candidates = i[(decon64[i] > decon64[i - 1]) & (decon64[i] > decon64[i + 1]) & (i >= shift) &
+                   (i < ssize + shift) & (decon64[i] > lda * maximum_decon) &
+                   (spectrum[i].astype(np.float64) > threshold * maximum / 100.0)]
+    positions = list()
+    for i in candidates:
+        window = decon64[i - 1:i + 2]
+        a = ((np.arange(i - 1, i + 2) - shift) * window).sum() / window.sum()
+        if a >= ssize:
+            a = ssize - 1
+        height = spectrum[shift + int(a)]
+        rank = 0
+        while rank < len(positions) and not height > spectrum[shift + int(positions[rank])]:
+            rank += 1
+        positions.insert(rank, dtype(a))
+        del positions[max_peaks:]
+    return np.array(positions, dtype=np.float64)
+
+
+def _window_mean(values, lo, hi, bw):
+    """Mean of values[w] over w in [c - bw, c + bw] (restricted to the array) for the centres c in lo..hi-1."""
+    centres = np.arange(lo, hi)
+    total = np.zeros(len(centres))
+    count = np.zeros(len(centres))
+    for offset in range(-bw, bw + 1):
+        w = centres + offset
+        valid = (w >= 0) & (w < len(values))
+        total[valid] += values[w[valid]]
+        count[valid] += 1
+    return total / count
+
+
+def _compton(spectrum, clipped, background):
+    """TSpectrum's Compton edge correction: background stretches that lie more than 1 below the spectrum are
+    replaced by the spectrum shape scaled between the edges of the stretch."""
+    ssize = len(spectrum)
+    spectrum = spectrum.astype(np.float64)
+    clipped64 = clipped.astype(np.float64)
+    far = np.abs(clipped64 - spectrum) >= 1
+    i = 0
+    while i < ssize:
+        if not far[i]:
+            i += 1
+            continue
+        b1 = max(i - 1, 0)
+        yb1 = clipped64[b1]
+        b2 = b1 + 1
+        while b2 < ssize:
+            b2 += 1
+            if not far[b2 - 1]:
+                break
+        if b2 == ssize:
+            b2 -= 1
+        yb2 = clipped64[b2]
+        if yb1 <= yb2:
+            c = (spectrum[b1:b2 + 1] - yb1).sum()
+            if c != 0:
+                d = np.cumsum(spectrum[b1:b2 + 1] - yb1)
+                background[b1:b2 + 1] = (yb2 - yb1) / c * d + yb1
+        else:
+            c = (spectrum[b2:b1 - 1 if b1 > 0 else None:-1] - yb2).sum()
+            if c != 0:
+                d = np.cumsum(spectrum[b2:b1 - 1 if b1 > 0 else None:-1] - yb2)
+                background[b2:b1 - 1 if b1 > 0 else None:-1] = (yb1 - yb2) / c * d + yb2
+        i = b2 + 1
+    return background
+
+
+def background(spectrum, iterations, smoothing=True, smooth_window=3, compton=False, dtype=np.float32):
+    """SNIP background of `spectrum` - TSpectrum::Background with a decreasing clipping window of `iterations`
+    channels and a 2nd order filter (option "Compton" sets `compton`).
+
+    Where TSpectrum refuses (fewer channels than the clipping window) the spectrum itself is returned.
+    """
+    spectrum = np.asarray(spectrum, dtype=dtype)
+    ssize = len(spectrum)
+    if ssize <= 0 or iterations < 1 or ssize < 2 * iterations + 1:
+        return spectrum.astype(np.float64)
+    bw = (smooth_window - 1) // 2
+    clipped = spectrum.copy()
+    for i in range(iterations, 0, -1):
+        a = clipped[i:ssize - i].astype(np.float64)
+        if smoothing:
+            b = (_window_mean(clipped, 0, ssize - 2 * i, bw) + _window_mean(clipped, 2 * i, ssize, bw)) / 2
+            average = _window_mean(clipped, i, ssize - i, bw)
+            clipped[i:ssize - i] = np.where(b < a, b, average)
+        else:
+            b = (clipped[:ssize - 2 * i] + clipped[2 * i:]) / 2.0
+            clipped[i:ssize - i] = np.minimum(a, b)
+    result = clipped.copy()
+    if compton:
+        _compton(spectrum, clipped, result)
+    return result.astype(np.float64)
+
+
+class NumpyPeakFinder(object):
+    """Peak finder backend running the numpy port (experimental, see the top of this file)."""
+
+    def search(self, source, sigma, threshold):
+        return search(source, sigma, threshold)
+
+    def background(self, source, iterations, compton=False):
+        return background(source, iterations, compton=compton)
+
+
+class TSpectrumPeakFinder(object):
+    """Peak finder backend running ROOT's TSpectrum on the arrays."""
+
+    def __init__(self):
+        from ROOT import TSpectrum
+        self.spectrum = TSpectrum(max_peaks)
+        self.kinds = (TSpectrum.kBackDecreasingWindow, TSpectrum.kBackOrder2, TSpectrum.kBackSmoothing3)
+
+    def _arrays(self, source, call):
+        # TSpectrum of ROOT 5 works on float arrays, from ROOT 6 on double arrays
+        from array import array
+        for typecode in ('d', 'f'):
+            buf = array(typecode, np.asarray(source, dtype=np.float64))
+            dest = array(typecode, buf)
+            try:
+                return buf, call(buf, dest)
+            except TypeError:
+                continue
+        raise TypeError('TSpectrum does not accept the source array')
+
+    def search(self, source, sigma, threshold):
+        sigma = _search_sigma(sigma, len(source))
+        buf, npeaks = self._arrays(source, lambda buf, dest: self.spectrum.SearchHighRes(
+            buf, dest, len(buf), sigma, 100. * threshold, True, deconvolution_iterations, False, 3))
+        found = self.spectrum.GetPositionX()
+        return np.array([found[i] for i in range(0, npeaks)], dtype=np.float64)
+
+    def background(self, source, iterations, compton=False):
+        direction, order, window = self.kinds
+        buf, message = self._arrays(source, lambda buf, dest: self.spectrum.Background(
+            buf, len(buf), iterations, direction, order, True, window, compton))
+        return np.array(buf, dtype=np.float64)
+
+
+backends = {'numpy': NumpyPeakFinder, 'tspectrum': TSpectrumPeakFinder}
+
+
+def peakfinder(name):
+    """The peak finder backend `name` ('numpy' or 'tspectrum')."""
+    return backends[name]()
+
@@ -0,0 +1,211 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Deferred plot rendering. The analysis only records what to draw: a PlotSpec holds the data arrays and the style of
+# one image. At the end of the run all specs are rendered on a pool of processes, each of which keeps one matplotlib
+# figure and one ROOT canvas and reuses them for every image it draws. The digest of every rendered spec is kept in
+# a manifest; an image whose file exists and whose spec has the same digest as in the previous run is not redrawn.
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+_worker = dict()  # figure and canvas of this process, created on first use
+
+
+class PlotSpec(object):
+    """One image to render: `kind` selects how it is drawn ('respondent' or 'peaks'), `path` is the png written and
+    the keyword arguments are the data and style the renderer of that kind uses."""
+
+    def __init__(self, kind, path, **data):
+        self.kind = kind
+        self.path = path
+        self.data = data
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['data'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def digest(self):
+        """SHA-1 of everything that ends up in the image."""
+        sha = hashlib.sha1()
+        _update(sha, (self.kind, self.path, sorted(self.data.items())))
+        return sha.hexdigest()
+
+
+def _update(sha, value):
+    if isinstance(value, np.ndarray):
+        sha.update(str(value.dtype) + str(value.shape))
+        sha.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, (list, tuple)):
+        sha.update('(%d' % len(value))
+        for item in value:
+            _update(sha, item)
+        sha.update(')')
+    else:
+        sha.update(repr(value))
+
+
+def load_manifest(path):
+    """Digests of the images rendered in earlier runs (image path -> digest)."""
+    if path is None or not os.path.exists(path):
+        return dict()
+    fhandle = open(path, 'r')
+    try:
+        return json.load(fhandle)
+    except ValueError:
+        return dict()
+    finally:
+        fhandle.close()
+
+
+def render(specs, workers, manifest=None):
+    """Render the PlotSpecs `specs` on a pool of `workers` processes, skipping images that are unchanged since the
+    run that wrote `manifest`. Returns the number of images rendered and skipped."""
+    digests = [spec.digest() for spec in specs]
+    known = load_manifest(manifest)
+    todo = [spec for spec, digest in zip(specs, digests) if not (known.get(spec.path) == digest and
+                                                                  os.path.exists(spec.path))]
+    if workers > 1 and len(todo) > 1:
+        pool = multiprocessing.Pool(min(workers, len(todo)))
+        try:
+            # large chunks, so every worker reuses its figure for many images
+            pool.map(_render_job, todo, chunksize=max(1, len(todo) // (4 * workers)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for spec in todo:
+            _render_job(spec)
+
+    if manifest is not None:
+        known.update(zip([spec.path for spec in specs], digests))
+        tmp = manifest + '.tmp'
+        fhandle = open(tmp, 'w')
+        json.dump(known, fhandle, indent=0, sort_keys=True)
+        fhandle.close()
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        os.rename(tmp, manifest)
+    return len(todo), len(specs) - len(todo)
+
+
+def suplabel(fig, axis, label, label_prop=None,
+             labelpad=5,
+             ha='center', va='center'):
+    ''' Add super ylabel or xlabel to the figure
+    Similar to matplotlib.suptitle
+    fig        - the matplotlib figure
+    axis       - string: "x" or "y"
+    label      - string
+    label_prop - keyword dictionary for Text
+    labelpad   - padding from the axis (default: 5)
+    ha         - horizontal alignment (default: "center")
+    va         - vertical alignment (default: "center")
+    '''
+    xmin = []
+    ymin = []
+    for ax in fig.axes:
+        xmin.append(ax.get_position().xmin)
+        ymin.append(ax.get_position().ymin)
+    xmin, ymin = min(xmin), min(ymin)
+    dpi = fig.dpi
+    if axis.lower() == "y":
+        rotation = 90.
+        x = xmin - float(labelpad) / dpi
+        y = 0.5
+    elif axis.lower() == 'x':
+        rotation = 0.
+        x = 0.5
+        y = ymin - float(labelpad) / dpi
+    else:
+        raise Exception("Unexpected axis: x or y")
+    if label_prop is None:
+        label_prop = dict()
+    fig.text(x, y, label, rotation=rotation,
+             ha=ha, va=va,
+             **label_prop)
+
+
+def _render_job(spec):
+    directory = os.path.dirname(spec.path)
+    if directory and not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass  # made by another worker in the meantime
+    renderers[spec.kind](spec)
+
+
+def _figure():
+    if 'figure' not in _worker:
+        # no pyplot: the agg canvas needs no display and the figure is reused for all images of this process
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.font_manager import FontProperties
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        _worker['figure'] = figure
+        _worker['font'] = FontProperties(size='small')
+    figure = _worker['figure']
+    figure.clf()
+    return figure, _worker['font']
+
+
+def _draw_respondent(spec):
+    # two panels over time: signal and tonic component on top, phasic component below
+    figure, fontP = _figure()
+    sp1 = figure.add_subplot(2, 1, 1)
+    for x, y, label in spec.top:
+        sp1.plot(x * spec.xscale, y, label=label)
+    sp1.set_title(spec.title)
+    sp1.legend(bbox_to_anchor=(1.1, 1.2), prop=fontP)
+    sp2 = figure.add_subplot(2, 1, 2)
+    for x, y, label in spec.bottom:
+        sp2.plot(x * spec.xscale, y, label=label)
+    sp2.legend(bbox_to_anchor=(1.1, 0.15), prop=fontP)
+    sp2.grid(True)
+    sp2.set_xlabel('time [s]')
+    suplabel(figure, 'y', spec.ylabel)
+    figure.savefig(spec.path)
+
+
+def _draw_peaks(spec):
+    # the respondent histogram in the searched range, with the peak markers and background as TSpectrum draws them
+    from ROOT import TCanvas, TH1F, TPolyMarker, gROOT, gStyle
+    if 'canvas' not in _worker:
+        gROOT.SetBatch(True)
+        gStyle.SetOptTitle(0)
+        gStyle.SetOptStat(0)
+        _worker['canvas'] = TCanvas("c", "c", 1200, 800)
+    canvas = _worker['canvas']
+    canvas.Clear()
+    canvas.cd()
+    nbins, xlow, xup = spec.axis
+    hist = TH1F("peaks", "peaks", nbins, xlow, xup)
+    hist.SetDirectory(0)  # not owned by the open output file when rendering in the main process
+    hist.SetContent(np.ascontiguousarray(spec.contents, dtype=np.float64))
+    hist.SetError(np.ascontiguousarray(spec.errors, dtype=np.float64))
+    hist.GetXaxis().SetRange(*spec.range)
+    hist.Draw()
+    background = hist.Clone("peaks_background")
+    background.SetDirectory(0)
+    background.Reset()
+    background.SetContent(np.ascontiguousarray(spec.background, dtype=np.float64))
+    background.SetLineColor(2)
+    background.Draw("same")
+    markers = TPolyMarker(len(spec.peaksx), np.ascontiguousarray(spec.peaksx, dtype=np.float64),
+                          np.ascontiguousarray(spec.peaksy, dtype=np.float64))
+    markers.SetMarkerStyle(23)
+    markers.SetMarkerColor(2)
+    markers.SetMarkerSize(1.3)
+    markers.Draw()
+    canvas.Update()
+    canvas.SaveAs(spec.path)
+
+
+renderers = {'respondent': _draw_respondent, 'peaks': _draw_peaks}
@@ -0,0 +1,216 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Storage of the respondent signals. All respondents share one (Names, Syncpos) MultiIndex which is built directly
+# from the per-respondent arrays: the respondent name is stored once as a categorical code per sample instead of
+# one python tuple per sample.
+# A SignalStore keeps one signal of all respondents as a single array with an offset per respondent segment. The
+# samples inside events (the non-NaN ones) are compacted once, and every consumer gets views of that copy instead of
+# re-filtering the whole cohort with dropna().loc[respondent].
+# Stores with the same layout are normalized together: the per-respondent min/max are reduced over the segment
+# boundaries and every segment is rescaled in place, without building per-respondent Series.
+# For cohorts that do not fit in memory the stores can live on disk: a StoreWriter appends the segment of every
+# respondent to one flat file per signal (sync positions shared by all signals) and writes the offset table, and
+# open_stores() memory-maps them, so only the pages of the respondent segments being processed are in memory. Derived
+# signals (tonic/phasic, normalized, the compacted samples) of such stores are allocated in unlinked scratch files in
+# the same directory instead of in memory.
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+def respondent_index(names, syncpos):
+    """(Names, Syncpos) MultiIndex of the respondents `names`, whose sync positions are the arrays in `syncpos`."""
+    return _multiindex(names, [len(positions) for positions in syncpos], np.concatenate(syncpos))
+
+
+def _multiindex(names, lengths, syncpos):
+    import pandas as pd
+    codes = np.repeat(np.arange(len(names), dtype=np.int32), lengths)
+    return pd.MultiIndex.from_arrays([pd.Categorical.from_codes(codes, names), syncpos], names=['Names', 'Syncpos'])
+
+
+def normalize(stores, inplace=False):
+    """Min-max normalize every respondent segment of the signals in `stores`, which share one layout.
+
+    Each segment becomes (x - min) / (max - min), with min and max ignoring NaN, like
+    (series.loc[p] - series.loc[p].min()) / (series.loc[p].max() - series.loc[p].min()). With `inplace` the values
+    of the stores are overwritten and the stores returned; otherwise all signals are written into one preallocated
+    buffer and a list of new stores (views of its rows) is returned.
+    """
+    layout = stores[0]
+    lengths = np.diff(layout.offsets)
+    filled = np.flatnonzero(lengths > 0)
+    if inplace:
+        rows = [store.values for store in stores]
+    else:
+        buffer = layout.allocate(len(stores))
+        rows = list(buffer)
+        for row, store in zip(rows, stores):
+            row[:] = store.values
+    for row in rows:
+        if len(filled) == 0:
+            continue
+        vmin = np.fmin.reduceat(row, layout.offsets[filled])
+        vmax = np.fmax.reduceat(row, layout.offsets[filled])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i, low, high in zip(filled, vmin, vmax):
+                segment = row[layout.offsets[i]:layout.offsets[i + 1]]
+                segment -= low
+                segment /= high - low
+    if inplace:
+        for store in stores:
+            store._valid = None
+        return stores
+    return [layout.like(row) for row in rows]
+
+
+class SignalStore(object):
+    """One signal of all respondents, partitioned by respondent.
+
+    `values` and `syncpos` are aligned with the (Names, Syncpos) MultiIndex; the samples of respondent names[i]
+    are values[offsets[i]:offsets[i + 1]]. NaN marks samples outside events. Stores opened with open_stores() have
+    memory-mapped arrays and a `directory` for the arrays derived from them (None for stores in memory).
+    """
+
+    def __init__(self, names, syncpos, values):
+        """Store the signal given as lists of per-respondent sync position and value arrays."""
+        lengths = [len(positions) for positions in syncpos]
+        self.names = list(names)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self.syncpos = np.concatenate(syncpos) if syncpos else np.zeros(0)
+        self.values = np.concatenate(values) if values else np.zeros(0)
+        self.directory = None
+        self._lookup = dict((name, i) for i, name in enumerate(self.names))
+        self._valid = None
+
+    def like(self, values):
+        """A store with the same respondents and sync positions holding `values` (aligned with this store)."""
+        store = SignalStore.__new__(SignalStore)
+        store.names, store.offsets, store.syncpos, store._lookup = self.names, self.offsets, self.syncpos, self._lookup
+        store.directory = self.directory
+        store.values = np.asarray(values, dtype=np.float64)
+        store._valid = None
+        return store
+
+    def allocate(self, rows=None, length=None):
+        """Uninitialised float64 array for a signal with this layout (`rows` of them if given, `length` samples
+        instead of all): in memory, or in an unlinked scratch file for stores on disk."""
+        length = len(self.values) if length is None else length
+        shape = (length,) if rows is None else (rows, length)
+        if self.directory is None or length == 0:
+            return np.empty(shape)
+        return np.memmap(tempfile.TemporaryFile(dir=self.directory), dtype=np.float64, mode='w+', shape=shape)
+
+    def index(self):
+        """The (Names, Syncpos) MultiIndex of the store."""
+        return _multiindex(self.names, np.diff(self.offsets), self.syncpos)
+
+    def to_series(self):
+        """The signal as a pd.Series on the (Names, Syncpos) MultiIndex."""
+        import pandas as pd
+        return pd.Series(self.values, index=self.index())
+
+    def segment(self, name):
+        """Sync positions and values of all samples of respondent `name` (views)."""
+        i = self._lookup[name]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.syncpos[lo:hi], self.values[lo:hi]
+
+    def valid(self, name):
+        """Sync positions and values of the non-NaN samples of respondent `name` (views of the compacted copy)."""
+        syncpos, values, offsets = self.compacted()
+        i = self._lookup[name]
+        return syncpos[offsets[i]:offsets[i + 1]], values[offsets[i]:offsets[i + 1]]
+
+    def compacted(self):
+        """Sync positions and values of the non-NaN samples of all respondents, with the offset of every respondent
+        segment in them (arrays shared by all views)."""
+        if self._valid is None:
+            self._compact()
+        return self._valid
+
+    def series(self, name):
+        """The non-NaN samples of respondent `name` as a pd.Series indexed by Syncpos - same as
+        series.dropna(axis=0).loc[name], without copying."""
+        import pandas as pd
+        syncpos, values = self.valid(name)
+        return pd.Series(values, index=pd.Index(syncpos, name='Syncpos', copy=False), copy=False)
+
+    def _compact(self):
+        if self.directory is None:
+            keep = ~np.isnan(self.values)
+            kept_before = np.concatenate(([0], np.cumsum(keep)))
+            self._valid = (self.syncpos[keep], self.values[keep], kept_before[self.offsets])
+            return
+        # on disk: one respondent segment at a time, into scratch files
+        keep = [~np.isnan(self.values[self.offsets[i]:self.offsets[i + 1]]) for i in range(0, len(self.names))]
+        offsets = np.concatenate(([0], np.cumsum([np.count_nonzero(k) for k in keep]))).astype(np.int64)
+        syncpos, values = self.allocate(length=offsets[-1]), self.allocate(length=offsets[-1])
+        for i in range(0, len(self.names)):
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            syncpos[offsets[i]:offsets[i + 1]] = self.syncpos[lo:hi][keep[i]]
+            values[offsets[i]:offsets[i + 1]] = self.values[lo:hi][keep[i]]
+        self._valid = (syncpos, values, offsets)
+
+
+class StoreWriter(object):
+    """Writes signals of all respondents to `directory`, one respondent at a time: the sync positions and every
+    signal go to flat float64 files in which each respondent is one contiguous segment, and close() writes the
+    table of respondent names and segment offsets that open_stores() reads."""
+
+    def __init__(self, directory, signals):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.signals = list(signals)
+        self.names = list()
+        self.lengths = list()
+        self._files = dict((name, open(os.path.join(directory, name + '.f8'), 'wb'))
+                           for name in ['syncpos'] + self.signals)
+
+    def append(self, name, syncpos, signals):
+        """Add respondent `name` with its sync positions and the dict of its signal arrays (same length)."""
+        self._files['syncpos'].write(np.ascontiguousarray(syncpos, dtype=np.float64).tostring())
+        for signal in self.signals:
+            values = np.ascontiguousarray(signals[signal], dtype=np.float64)
+            if len(values) != len(syncpos):
+                raise ValueError("Signal %s of %s does not match its sync positions" % (signal, name))
+            self._files[signal].write(values.tostring())
+        self.names.append(name)
+        self.lengths.append(len(syncpos))
+
+    def close(self):
+        """Finish the files and return the stores, as open_stores() does."""
+        for fhandle in self._files.values():
+            fhandle.close()
+        offsets = np.concatenate(([0], np.cumsum(self.lengths))).astype(np.int64)
+        fhandle = open(os.path.join(self.directory, 'table.json'), 'w')
+        json.dump(dict(names=self.names, offsets=offsets.tolist(), signals=self.signals), fhandle)
+        fhandle.close()
+        return open_stores(self.directory)
+
+
+def open_stores(directory, mode='r+'):
+    """The signals written to `directory` by a StoreWriter, as a dict of signal name -> memory-mapped SignalStore
+    (all sharing one layout)."""
+    fhandle = open(os.path.join(directory, 'table.json'), 'r')
+    table = json.load(fhandle)
+    fhandle.close()
+    offsets = np.array(table['offsets'], dtype=np.int64)
+    layout = SignalStore.__new__(SignalStore)
+    layout.names = [str(name) for name in table['names']]
+    layout.offsets = offsets
+    layout.syncpos = _map(os.path.join(directory, 'syncpos.f8'), offsets[-1], mode)
+    layout.directory = directory
+    layout._lookup = dict((name, i) for i, name in enumerate(layout.names))
+    return dict((str(signal), layout.like(_map(os.path.join(directory, signal + '.f8'), offsets[-1], mode)))
+                for signal in table['signals'])
+
+
+def _map(path, length, mode):
+    if length == 0:
+        return np.zeros(0)
+    return np.memmap(path, dtype=np.float64, mode=mode, shape=(int(length),))
@@ -1,59 +1,252 @@
 #! /usr/bin/env python
 
-from math import log, sqrt
+import multiprocessing
+from math import exp, sqrt
 
-from numpy import array, random
+from numpy import (arange, argsort, array, asarray, broadcast_to, concatenate, cumsum, empty, errstate, floor,
+                   isinf, lexsort, log1p, minimum, random, repeat, searchsorted, unique, zeros)
 from scipy.stats import percentileofscore, poisson
 
+max_chunk_entries = 1 << 22 # toys x windows evaluated at once
+toys_per_stream = 1000 # toys drawn from one seeded random stream (fixed, so results do not depend on the workers)
+log_tail_cache_size = 1 << 14 # (d, m) pairs kept at least in the log tail cache (it grows with the lookups)
+
+def search_windows(search_lo, search_hi):
+    """[lo, hi) of all windows as two arrays, in the order they are scanned:
+    widths from one bin up to half of the search range, each moved in steps of half its width"""
+    lows, highs = [], []
+    for binwidth in xrange(1, (search_hi - search_lo) // 2):
+        step = max(1, binwidth // 2) # Step size <- half binwidth
+        pos = arange(search_lo, search_hi - binwidth, step)
+        lows.append(pos)
+        highs.append(pos + binwidth)
+    if not lows:
+        return zeros(0, int), zeros(0, int)
+    return concatenate(lows), concatenate(highs)
+
+def pairwise_sums(rows):
+    """Sums over the last axis of `rows`, added in the order numpy adds a 1-D slice in values[lo:hi].sum():
+    eight running sums in blocks of up to 128 values and halves above that. All rows are added together,
+    and every row gets the same rounding as its slice sum"""
+    n = rows.shape[-1]
+    if n < 8:
+        total = zeros(rows.shape[:-1], rows.dtype)
+        for i in xrange(0, n):
+            total += rows[..., i]
+        return total
+    if n <= 128:
+        partial = rows[..., :8].copy()
+        for i in xrange(8, n - n % 8, 8):
+            partial += rows[..., i:i + 8]
+        total = ((partial[..., 0] + partial[..., 1]) + (partial[..., 2] + partial[..., 3])) + \
+                ((partial[..., 4] + partial[..., 5]) + (partial[..., 6] + partial[..., 7]))
+        for i in xrange(n - n % 8, n):
+            total += rows[..., i]
+        return total
+    half = n // 2 - (n // 2) % 8
+    return pairwise_sums(rows[..., :half]) + pairwise_sums(rows[..., half:])
+
+def window_sums(values, lo, hi):
+    """values[lo:hi].sum() of all windows (for every row of a 2-D `values`). Integer counts from cumulative
+    sums (exact); weighted values gathered into one row per window and added with pairwise_sums, so each
+    window is summed on its own and the sums are bit-identical to the slice sums"""
+    values = asarray(values)
+    if values.dtype.kind in 'biu' or ((values == floor(values)).all() and abs(values).sum() < 2.**53):
+        sums = cumsum(values, axis=-1)
+        cumulative = concatenate((zeros(values.shape[:-1] + (1,), sums.dtype), sums), axis=-1)
+        return cumulative[..., hi] - cumulative[..., lo]
+    lo, hi = asarray(lo, int), asarray(hi, int)
+    sums = zeros(values.shape[:-1] + (len(lo),), values.dtype)
+    for width in unique(hi - lo):
+        same, = (hi - lo == width).nonzero()
+        sums[..., same] = pairwise_sums(values[..., lo[same, None] + arange(width)])
+    return sums
+
+def poisson_logtail(d, m):
+    "log P(n >= d) for Poisson means m, finite also where P itself underflows"
+    with errstate(divide='ignore'):
+        logp = poisson.logsf(d - 1, m)
+    deep = isinf(logp)
+    if deep.any():
+        # Far in the tail P(n >= d) = pmf(d) (1 + m/(d+1) + m^2/((d+1)(d+2)) + ..) -> pmf(d) / (1 - m/(d+1))
+        d, m = d[deep], m[deep]
+        logp[deep] = poisson.logpmf(d, m) - log1p(-m / (d + 1.))
+    return logp
+
+class LogTailCache(object):
+    """poisson_logtail memoized per (d, m). The pairs are kept as sorted complex keys d + i*m, so a lookup
+    is a unique/searchsorted over arrays and one poisson_logtail call for the misses; beyond `maxsize` pairs
+    the ones least recently looked up are dropped. `maxsize` grows to twice the pairs of the largest lookup
+    (for toys: the windows times the counts the toys of a chunk reach in them), so the pairs of one chunk
+    are still there for the next"""
+
+    def __init__(self, maxsize=log_tail_cache_size):
+        self.maxsize = maxsize
+        self.keys = zeros(0, complex)
+        self.values = zeros(0)
+        self.used = zeros(0, int) # lookup in which each pair was last used
+        self.lookups = 0
+        self.misses = 0 # pairs computed with poisson_logtail
+
+    def lookup(self, d, m):
+        "log P(n >= d) for the 1-D arrays of counts `d` and means `m`"
+        self.lookups += 1
+        keys, inverse = unique(asarray(d, float) + 1j * asarray(m, float), return_inverse=True)
+        self.maxsize = max(self.maxsize, 2 * len(keys))
+        logp = empty(len(keys))
+        at = minimum(searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        hit = self.keys[at] == keys if len(self.keys) else zeros(len(keys), bool)
+        logp[hit] = self.values[at[hit]]
+        self.used[at[hit]] = self.lookups
+        missing = ~hit
+        if missing.any():
+            self.misses += missing.sum()
+            logp[missing] = poisson_logtail(keys[missing].real, keys[missing].imag)
+            keys = concatenate((self.keys, keys[missing]))
+            values = concatenate((self.values, logp[missing]))
+            used = concatenate((self.used, repeat(self.lookups, missing.sum())))
+            keep = arange(len(keys))
+            if len(keys) > self.maxsize:
+                keep = argsort(used, kind='mergesort')[len(keys) - self.maxsize:]
+            keep = keep[argsort(keys[keep])]
+            self.keys, self.values, self.used = keys[keep], values[keep], used[keep]
+        return logp[inverse]
+
+log_tails = LogTailCache()
+
+def window_logpvalues(d, m):
+    """log P(n >= d) for a Poisson mean m, of every window (of every toy for 2-D `d`);
+    0 for dips and windows without prediction"""
+    m = broadcast_to(m, d.shape)
+    logp = zeros(d.shape)
+    excess = (m != 0) & ~(d < m) # "Dips" get ignored.
+    if d.ndim == 1 or d.dtype.kind not in 'iu' or not d.size:
+        logp[excess] = log_tails.lookup(d[excess], m[excess])
+        return logp, excess
+    # Toys: a table per window over the counts the toys reach in it, each (d, m) looked up once
+    dlo = d.min(axis=0)
+    span = d.max(axis=0) - dlo + 1
+    start = concatenate(([0], cumsum(span)[:-1]))
+    counts = arange(span.sum()) - repeat(start - dlo, span)
+    means = repeat(m[0], span)
+    table = zeros(len(counts))
+    reached = (means != 0) & ~(counts < means)
+    table[reached] = log_tails.lookup(counts[reached], means[reached])
+    logp[excess] = table[(start + d - dlo)[excess]]
+    return logp, excess
+
 def evaluate_statistic(data, mc, verbose=False, edges=None):
     # Get search range (first bin with data, last bin with data)
     nzi, = mc.nonzero() # nzi = non-zero indices
     search_lo, search_hi = nzi[0], nzi[-1]
 
-    def all_windows():
-        "Iterator returning [lo, hi) for all windows"
-        # Try windows from one bin in width up to half of the full range
-        min_win_size, max_win_size = 1, (search_hi - search_lo) // 2
-        for binwidth in xrange(min_win_size, max_win_size):
-            if verbose: print " --- binwidth = ", binwidth
-            step = max(1, binwidth // 2) # Step size <- half binwidth
-            for pos in xrange(search_lo, search_hi - binwidth, step):
-                yield pos, pos + binwidth
-
-    def pvalue(lo, hi):
-        "Compute p value in window [lo, hi)"
-        d, m = data[lo:hi].sum(), mc[lo:hi].sum()
-        if m == 0:
-            # MC prediction is zero. Not sure what then..
-            assert d == 0, "Data = {0} where the prediction is zero..".format(d)
-            return 1
-        if d < m: return 1 # "Dips" get ignored.
+    # All windows at once: sums from cumulative sums, p values in log space from the cache
+    lo, hi = search_windows(search_lo, search_hi)
+    d, m = window_sums(data, lo, hi), window_sums(mc, lo, hi)
+    logp, excess = window_logpvalues(d, m)
+    # MC prediction is zero. Not sure what then..
+    nodata = (m == 0) & (d != 0)
+
+    if verbose:
+        report_windows(search_lo, search_hi, lo, hi, d, m, logp, excess, nodata, edges)
+    if nodata.any():
+        assert False, "Data = {0} where the prediction is zero..".format(d[nodata.argmax()])
+    if len(logp) == 0:
+        raise ValueError("min() arg is an empty sequence")
 
-        # P(d >= m)
-        p = 1 - poisson.cdf(d-1, m)
+    # Smallest p value, ties going to the first window by (lo, hi)
+    best = lexsort((hi, lo, logp))[0]
+    return -logp[best], (int(lo[best]), int(hi[best]))
 
-        if verbose and edges:
-            print "{0:2} {1:2} [{2:8.3f}, {3:8.3f}] {4:7.0f} {5:7.3f} {6:.5f} {7:.2f}".format(
-                lo, hi, edges[lo], edges[hi], d, m, p, -log(p))
+def report_windows(search_lo, search_hi, lo, hi, d, m, logp, excess, nodata, edges):
+    "Print the windows in scan order, as the scan does in verbose mode"
+    i = 0
+    for binwidth in xrange(1, (search_hi - search_lo) // 2):
+        print " --- binwidth = ", binwidth
+        while i < len(lo) and hi[i] - lo[i] == binwidth:
+            assert not nodata[i], "Data = {0} where the prediction is zero..".format(d[i])
+            if excess[i] and edges:
+                print "{0:2} {1:2} [{2:8.3f}, {3:8.3f}] {4:7.0f} {5:7.3f} {6:.5f} {7:.2f}".format(
+                    int(lo[i]), int(hi[i]), edges[lo[i]], edges[hi[i]], d[i], m[i], exp(logp[i]), -logp[i])
+            i += 1
 
-        return p
+def toy_chunksize(mc):
+    "Number of toys evaluated together, so that toys x windows stays below max_chunk_entries"
+    nzi, = mc.nonzero()
+    lo, hi = search_windows(nzi[0], nzi[-1])
+    return max(1, max_chunk_entries // max(1, len(lo)))
 
-    min_pvalue, (lo, hi) = min((pvalue(lo, hi), (lo, hi))
-                               for lo, hi in all_windows())
+def toy_statistics(toys, mc, chunksize=None):
+    """evaluate_statistic(pe, mc)[0] of every row `pe` of the 2-D `toys`, as a list.
+    All windows of `chunksize` toys at a time are evaluated together"""
+    nzi, = mc.nonzero()
+    lo, hi = search_windows(nzi[0], nzi[-1])
+    m = window_sums(mc, lo, hi)
+    if chunksize is None:
+        chunksize = toy_chunksize(mc)
 
-    return -log(min_pvalue), (lo, hi)
+    statistics = []
+    for start in xrange(0, len(toys), chunksize):
+        d = window_sums(toys[start:start + chunksize], lo, hi)
+        logp, excess = window_logpvalues(d, m)
+        nodata = (m == 0) & (d != 0)
+        logpmin = logp.min(axis=1) if len(lo) else zeros(len(d))
+        for i in xrange(len(d)):
+            # MC prediction is zero. Not sure what then..
+            assert not nodata[i].any(), "Data = {0} where the prediction is zero..".format(d[i][nodata[i]][0])
+            if len(lo) == 0:
+                raise ValueError("min() arg is an empty sequence")
+            statistics.append(-logpmin[i])
+    return statistics
 
 def make_toys(prediction, n):
     "fluctuate `prediction` input distribution `n` times"
     return random.mtrand.poisson(prediction, size=(n, len(prediction)))
 
-def bumphunter(hdata, hmc, n):
-    "Compute the bumphunter statistic and run `n` pseudo-experiments"
+def stream_toy_statistics(job):
+    "Statistics of the toys of one seeded stream: job = (mc, seed, stream, number of toys)"
+    mc, seed, stream, ntoys = job
+    toys = random.RandomState([seed, stream]).poisson(mc, size=(ntoys, len(mc)))
+    return toy_statistics(toys, mc)
+
+def seeded_toy_statistics(mc, n, seed, workers=1):
+    """Statistics of `n` toys, drawn in streams of toys_per_stream toys seeded with [seed, stream number]
+    and evaluated on `workers` processes. The same for a given seed whatever the number of workers"""
+    jobs = [(mc, seed, stream, min(toys_per_stream, n - start))
+            for stream, start in enumerate(xrange(0, n, toys_per_stream))]
+    statistics = []
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            # results come back in stream order as the workers finish them
+            for stream_statistics in pool.imap(stream_toy_statistics, jobs):
+                statistics.extend(stream_statistics)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            statistics.extend(stream_toy_statistics(job))
+    return statistics
+
+def bumphunter(hdata, hmc, n, seed=None, workers=1):
+    """Compute the bumphunter statistic and run `n` pseudo-experiments.
+    With a `seed` (or `workers` > 1) the toys come from seeded streams, see seeded_toy_statistics;
+    otherwise from the global numpy random state"""
     data = array([hdata[i] for i in xrange(1, hdata.GetNbinsX())])
     mc   = array([hmc[i]   for i in xrange(1, hmc.GetNbinsX())])
 
-    pseudo_experiments = [evaluate_statistic(pe, mc)[0]
-                          for pe in make_toys(mc, n)]
+    if seed is None and workers > 1:
+        seed = random.randint(0, 2**31) # still reproducible with numpy.random.seed
+    if seed is not None:
+        pseudo_experiments = seeded_toy_statistics(mc, n, seed, workers)
+    else:
+        # Toys are made and evaluated a chunk at a time; the chunks continue one random stream,
+        # so they are the same toys as one make_toys(mc, n)
+        chunksize = toy_chunksize(mc)
+        pseudo_experiments = []
+        for start in xrange(0, n, chunksize):
+            pseudo_experiments.extend(toy_statistics(make_toys(mc, min(chunksize, n - start)), mc, chunksize))
 
     measurement, (lo, hi) = evaluate_statistic(data, mc)
 
@@ -62,3 +255,59 @@ def bumphunter(hdata, hmc, n):
 
     return measurement, (lo, hi), pseudo_experiments, pvalue, pvalue_uncertainty
 
+def toy_pvalue(nless, nequal, n):
+    """1 - percentileofscore(toys, measurement) / 100 from the number of toy statistics below and
+    equal to the measurement"""
+    left, right = nless, nless + nequal
+    return 1. - ((right + left + (1 if right > left else 0)) * 50.0 / n) / 100.
+
+def sequential_bumphunter(hdata, hmc, max_toys, relative_uncertainty=0.1, pvalue_threshold=0.05, nsigma=3.,
+                          seed=None, workers=1):
+    """bumphunter with as many toys as needed: toys are run a stream (toys_per_stream toys) at a time
+    until the p value is known to `relative_uncertainty`, or is clearly non-significant (more than
+    `nsigma` uncertainties above `pvalue_threshold`), or `max_toys` toys have been run.
+    Returns the same as bumphunter, whose result it equals for the number of toys it ran (with the same
+    seed, which is drawn from numpy's random state if not given)"""
+    data = array([hdata[i] for i in xrange(1, hdata.GetNbinsX())])
+    mc   = array([hmc[i]   for i in xrange(1, hmc.GetNbinsX())])
+
+    measurement, (lo, hi) = evaluate_statistic(data, mc)
+
+    if seed is None:
+        seed = random.randint(0, 2**31) # still reproducible with numpy.random.seed
+    jobs = [(mc, seed, stream, min(toys_per_stream, max_toys - start))
+            for stream, start in enumerate(xrange(0, max_toys, toys_per_stream))]
+    pool = multiprocessing.Pool(min(workers, len(jobs))) if workers > 1 and len(jobs) > 1 else None
+    pseudo_experiments = []
+    nless = nequal = 0
+    done = False
+    try:
+        # one stream per worker at a time; the stopping rules are checked after every stream, in stream
+        # order, so the toys used do not depend on the number of workers
+        for first in xrange(0, len(jobs), max(1, workers)):
+            batch = jobs[first:first + max(1, workers)]
+            results = pool.map(stream_toy_statistics, batch) if pool else map(stream_toy_statistics, batch)
+            for stream_statistics in results:
+                pseudo_experiments.extend(stream_statistics)
+                statistics = array(stream_statistics)
+                nless += (statistics < measurement).sum()
+                nequal += (statistics == measurement).sum()
+                n = len(pseudo_experiments)
+                pvalue = toy_pvalue(nless, nequal, n)
+                uncertainty = sqrt(pvalue * (1. - pvalue) / n)
+                if (pvalue > 0 and uncertainty <= relative_uncertainty * pvalue or
+                        pvalue - nsigma * uncertainty > pvalue_threshold):
+                    done = True
+                    break
+            if done:
+                break
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    n = len(pseudo_experiments)
+    pvalue = 1. - (percentileofscore(pseudo_experiments, measurement) / 100.)
+    pvalue_uncertainty = sqrt(pvalue * (1. - pvalue) / n)
+
+    return measurement, (lo, hi), pseudo_experiments, pvalue, pvalue_uncertainty
@@ -0,0 +1,102 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Tests of the vectorised bumphunter in bin/BH.py: the window sums against plain slice sums, the window the
+# statistic picks when the sums are taken one slice at a time, and the log tail cache across chunks of toys.
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from bin import BH
+
+
+def _slice_sums(values, lo, hi):
+    values = np.asarray(values)
+    sums = [values[..., l:h].sum(axis=-1) for l, h in zip(lo, hi)]
+    return np.stack(sums, axis=-1) if sums else np.zeros(values.shape[:-1] + (0,))
+
+
+class WindowSumsTest(unittest.TestCase):
+
+    def test_weighted_same_as_slices(self):
+        rng = np.random.RandomState(21)
+        for n in (2, 7, 9, 60, 150, 300, 700):
+            values = rng.exponential(1., n) * 10 ** rng.uniform(-3, 3, n)
+            lo, hi = BH.search_windows(0, n)
+            np.testing.assert_array_equal(BH.window_sums(values, lo, hi), _slice_sums(values, lo, hi))
+
+    def test_weighted_rows_same_as_slices(self):
+        rng = np.random.RandomState(22)
+        values = rng.uniform(0., 5., (3, 200))
+        lo, hi = BH.search_windows(10, 190)
+        expected = np.array([_slice_sums(row, lo, hi) for row in values])
+        np.testing.assert_array_equal(BH.window_sums(values, lo, hi), expected)
+
+    def test_counts_same_as_slices(self):
+        rng = np.random.RandomState(23)
+        values = rng.poisson(20., (5, 150))
+        lo, hi = BH.search_windows(0, 150)
+        np.testing.assert_array_equal(BH.window_sums(values, lo, hi), _slice_sums(values, lo, hi))
+
+    def test_small_window_next_to_large_values(self):
+        values = np.array([1e17, 1e17, 1e-3, 0., 2e-3])
+        np.testing.assert_array_equal(BH.window_sums(values, np.array([2, 3, 2]), np.array([3, 4, 5])),
+                                      [1e-3, 0., 3e-3])
+
+    def test_no_windows(self):
+        self.assertEqual(BH.window_sums(np.array([0.5, 1.5]), np.zeros(0, int), np.zeros(0, int)).shape, (0,))
+
+
+class ChosenWindowTest(unittest.TestCase):
+
+    def test_same_window_as_slice_sums(self):
+        rng = np.random.RandomState(24)
+        window_sums = BH.window_sums
+        for trial in range(0, 20):
+            mc = rng.uniform(5., 50., 120) * rng.uniform(0.2, 1.)
+            data = rng.poisson(mc)
+            expected = BH.evaluate_statistic(data, mc)
+            try:
+                BH.window_sums = _slice_sums
+                sliced = BH.evaluate_statistic(data, mc)
+            finally:
+                BH.window_sums = window_sums
+            self.assertEqual(expected, sliced)
+
+
+class LogTailCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log_tails = BH.log_tails
+
+    def tearDown(self):
+        BH.log_tails = self.log_tails
+
+    def test_warm_cache_second_chunk(self):
+        rng = np.random.RandomState(25)
+        for nbins in (80, 150):
+            mc = 1000. * np.exp(-np.linspace(0., 5., nbins)) + 2.
+            toys = rng.poisson(mc, (2000, nbins))
+            BH.log_tails = BH.LogTailCache()
+            BH.toy_statistics(toys[:1000], mc, 1000)
+            first = BH.log_tails.misses
+            BH.toy_statistics(toys[1000:], mc, 1000)
+            # only the counts the first chunk did not reach are new
+            self.assertLess(BH.log_tails.misses - first, 0.1 * first, nbins)
+
+    def test_same_values_after_eviction(self):
+        d = np.arange(0., 60.)
+        m = np.full(60, 30.)
+        cache = BH.LogTailCache(maxsize=50)
+        for lo in range(0, 60, 20):
+            cache.lookup(d[lo:lo + 20], m[lo:lo + 20])
+        self.assertEqual(len(cache.keys), 50)
+        np.testing.assert_array_equal(cache.lookup(d[:20], m[:20]), BH.poisson_logtail(d[:20], m[:20]))
+        self.assertEqual(cache.misses, 70)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Tests of the numpy port of TSpectrum in peakfinder.py: against the TSpectrum results recorded in
+# data/tspectrum_reference.json, against TSpectrum itself where ROOT is installed, and on cases whose result
+# follows from the algorithm (flat spectra, too few channels, ordering and threshold of the peaks).
+
+import json
+import os
+import unittest
+
+import numpy as np
+
+from tspectrum_reference import _gaussians, background_iterations, histograms, reference_file
+import peakfinder
+
+
+def _tspectrum():
+    try:
+        return peakfinder.TSpectrumPeakFinder()
+    except ImportError:
+        return None
+
+
+class RecordedTSpectrumTest(unittest.TestCase):
+
+    def setUp(self):
+        if not os.path.exists(reference_file):
+            self.skipTest("no recorded TSpectrum results, run tests/tspectrum_reference.py with ROOT")
+        fhandle = open(reference_file, 'r')
+        self.recorded = json.load(fhandle)
+        fhandle.close()
+
+    def test_peaks(self):
+        for name, (contents, sigma, threshold) in histograms().items():
+            expected = self.recorded[name]['peaks']
+            found = peakfinder.search(contents, sigma, threshold)
+            self.assertEqual(len(found), len(expected), name)
+            np.testing.assert_allclose(found, expected, rtol=1e-6, atol=1e-6, err_msg=name)
+
+    def test_background(self):
+        for name, (contents, sigma, threshold) in histograms().items():
+            expected = self.recorded[name]['background']
+            found = peakfinder.background(contents, background_iterations, compton=True)
+            np.testing.assert_allclose(found, expected, rtol=1e-6, atol=1e-6, err_msg=name)
+
+
+class LiveTSpectrumTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tspectrum = _tspectrum()
+        if self.tspectrum is None:
+            self.skipTest("ROOT is not installed")
+
+    def test_same_peak_bins(self):
+        for name, (contents, sigma, threshold) in histograms().items():
+            expected = self.tspectrum.search(contents, sigma, threshold)
+            found = peakfinder.search(contents, sigma, threshold)
+            np.testing.assert_array_equal(peakfinder.peak_bins(found, 1), peakfinder.peak_bins(expected, 1),
+                                          err_msg=name)
+
+    def test_same_background(self):
+        for name, (contents, sigma, threshold) in histograms().items():
+            expected = self.tspectrum.background(contents, background_iterations, compton=True)
+            found = peakfinder.background(contents, background_iterations, compton=True)
+            np.testing.assert_allclose(found, expected, rtol=1e-6, atol=1e-6, err_msg=name)
+
+
+class PeakFinderTest(unittest.TestCase):
+
+    def test_flat_spectrum(self):
+        flat = np.full(200, 4.)
+        self.assertEqual(len(peakfinder.search(flat, 3, 0.05)), 0)
+        np.testing.assert_array_equal(peakfinder.background(flat, background_iterations, compton=True), flat)
+
+    def test_too_few_channels(self):
+        # TSpectrum refuses to search or clip fewer channels than the clipping window
+        short = _gaussians(40, [(20, 10., 2.)])
+        self.assertEqual(len(peakfinder.search(short, 3, 0.05)), 0)
+        np.testing.assert_array_equal(peakfinder.background(short, background_iterations), np.float32(short))
+
+    def test_single_peak(self):
+        found = peakfinder.search(_gaussians(200, [(100, 10., 3.)]), 3, 0.05)
+        self.assertEqual(len(found), 1)
+        self.assertAlmostEqual(found[0], 100., places=3)
+        np.testing.assert_array_equal(peakfinder.peak_bins(found, 11), [111])
+
+    def test_highest_first(self):
+        found = peakfinder.search(_gaussians(200, [(60, 5., 3.), (140, 10., 3.)]), 3, 0.05)
+        np.testing.assert_allclose(found, [140., 60.], atol=1e-3)
+
+    def test_threshold(self):
+        contents = _gaussians(200, [(60, 10., 3.), (140, 0.3, 3.)])
+        self.assertEqual(len(peakfinder.search(contents, 3, 0.05)), 1)
+        self.assertEqual(len(peakfinder.search(contents, 3, 0.01)), 2)
+
+    def test_edge_peaks_inside(self):
+        for centre in (0, 199):
+            found = peakfinder.search(_gaussians(200, [(centre, 10., 3.)]), 3, 0.05)
+            self.assertEqual(len(found), 1)
+            self.assertTrue(-1 < found[0] < 200, found)
+
+    def test_at_most_max_peaks(self):
+        comb = _gaussians(3000, [(15 + 25 * k, 10., 2.) for k in range(0, 119)])
+        self.assertEqual(len(peakfinder.search(comb, 2, 0.05)), peakfinder.max_peaks)
+
+
+if __name__ == '__main__':
+    unittest.main()
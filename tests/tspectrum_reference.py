@@ -0,0 +1,65 @@
+# coding=utf-8
+######## DR Audience Research ##############
+# Reference histograms for the peak finder tests and the recorder of their TSpectrum results. Run with ROOT
+# available to (re)write data/tspectrum_reference.json:
+#     python tests/tspectrum_reference.py
+# The file holds, per histogram, the peaks of TSpectrum::SearchHighRes (option "noMarkov") and the contents of
+# TSpectrum::Background(.., 20, "Compton"), exactly as peakfinder.TSpectrumPeakFinder returns them.
+
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Fysiologisk'))
+
+reference_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tspectrum_reference.json')
+background_iterations = 20
+
+
+def _gaussians(n, peaks, base=1.):
+    t = np.arange(0, n, dtype=np.float64)
+    contents = np.full(n, base)
+    for centre, height, width in peaks:
+        contents += height * np.exp(-(t - centre) ** 2 / (2. * width * width))
+    return contents
+
+
+def histograms():
+    """name -> (contents, sigma, threshold) of the reference histograms."""
+    rng = np.random.RandomState(14)
+    noisy = _gaussians(400, [(80, 30., 4.), (150, 12., 3.), (300, 20., 6.)], base=5.) + rng.poisson(3., 400)
+    drift = _gaussians(300, [(70, 0.02, 3.), (210, 0.035, 5.)], base=0.) + np.linspace(0.01, 0.002, 300)
+    return {
+        'single': (_gaussians(200, [(100, 10., 3.)]), 3, 0.05),
+        'pair': (_gaussians(200, [(60, 10., 3.), (140, 5., 3.)]), 3, 0.05),
+        'below_threshold': (_gaussians(200, [(60, 10., 3.), (140, 0.3, 3.)]), 3, 0.05),
+        'left_edge': (_gaussians(200, [(0, 10., 3.), (120, 4., 3.)]), 3, 0.05),
+        'right_edge': (_gaussians(200, [(199, 10., 3.), (50, 4., 3.)]), 3, 0.05),
+        'flat': (np.full(200, 4.), 3, 0.05),
+        'zero': (np.zeros(200), 3, 0.05),
+        'short': (_gaussians(40, [(20, 10., 2.)]), 3, 0.05),
+        'default_sigma': (_gaussians(500, [(250, 10., 4.)]), 0, 0.05),
+        'noisy': (noisy, 2, 0.05),
+        'normalised_drift': (drift / drift.sum(), 4, 0.05),
+    }
+
+
+def record(path=reference_file):
+    """Write the TSpectrum peaks and backgrounds of all reference histograms to `path`."""
+    from peakfinder import TSpectrumPeakFinder
+    finder = TSpectrumPeakFinder()
+    recorded = dict()
+    for name, (contents, sigma, threshold) in sorted(histograms().items()):
+        recorded[name] = dict(peaks=finder.search(contents, sigma, threshold).tolist(),
+                              background=finder.background(contents, background_iterations, compton=True).tolist())
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    fhandle = open(path, 'w')
+    json.dump(recorded, fhandle, indent=1, sort_keys=True)
+    fhandle.close()
+
+
+if __name__ == '__main__':
+    record()